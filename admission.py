@@ -0,0 +1,145 @@
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+# Lower runs first; anything not listed is chit-chat
+PRIORITIES = {"emotional_checkin": 0, "escalation": 0, "bedtime_story": 1}
+DEFAULT_PRIORITY = 2
+# Work nobody is waiting on, such as pre-generated stories; first to be bumped
+BACKGROUND_PRIORITY = 3
+
+
+class Overloaded(Exception):
+    pass
+
+
+class _Waiter:
+    def __init__(self, priority, seq, requests, tokens):
+        self.priority = priority
+        self.seq = seq
+        self.requests = requests
+        self.tokens = tokens
+        self.bumped = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+# Requests-per-minute and tokens-per-minute budgets shared by every LLM call in the
+# process, as two token buckets that refill continuously. A caller reserves its
+# estimated calls and tokens up front and hands the reservation back when done;
+# what was actually spent is read from the LLM's own usage counters (`usage` returns
+# cumulative (requests, tokens)), so estimates never drift from the real bill.
+# Callers queue by priority, then arrival. When max_queue are already waiting, a
+# newcomer takes the place of the lowest-priority waiter if it outranks it, and is
+# turned away at once otherwise; nobody waits longer than max_wait seconds.
+# A budget of 0 means unlimited.
+class AdmissionController:
+    def __init__(self, rpm=0, tpm=0, max_queue=64, max_wait=10.0, usage=None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.usage = usage or (lambda: (0, 0))
+        self.admitted = {}
+        self.rejected = {}
+        self._requests_left = float(rpm)
+        self._tokens_left = float(tpm)
+        self._refilled_at = time.monotonic()
+        self._used = self.usage()
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        used = self.usage()
+        spent_requests, spent_tokens = used[0] - self._used[0], used[1] - self._used[1]
+        self._used = used
+        if self.rpm:
+            self._requests_left = min(self.rpm, self._requests_left + elapsed * self.rpm / 60 - spent_requests)
+        if self.tpm:
+            self._tokens_left = min(self.tpm, self._tokens_left + elapsed * self.tpm / 60 - spent_tokens)
+
+    # Seconds until both buckets can cover the waiter, 0 if they already do
+    def _shortfall(self, waiter):
+        wait = 0.0
+        if self.rpm and self._requests_left < waiter.requests:
+            wait = max(wait, (waiter.requests - self._requests_left) * 60 / self.rpm)
+        if self.tpm and self._tokens_left < waiter.tokens:
+            wait = max(wait, (waiter.tokens - self._tokens_left) * 60 / self.tpm)
+        return wait
+
+    def acquire(self, priority, requests=1, tokens=0):
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                lowest = max(self._queue) if self._queue else None
+                if lowest is None or lowest.priority <= priority:
+                    self.rejected[priority] = self.rejected.get(priority, 0) + 1
+                    raise Overloaded()
+                self._drop(lowest)
+                lowest.bumped = True
+            # Never ask for more than a full bucket, or the call could never run
+            waiter = _Waiter(priority, next(self._seq), min(requests, self.rpm or requests), min(tokens, self.tpm or tokens))
+            heapq.heappush(self._queue, waiter)
+            deadline = time.monotonic() + self.max_wait
+            while True:
+                if waiter.bumped:
+                    self.rejected[priority] = self.rejected.get(priority, 0) + 1
+                    raise Overloaded()
+                self._refill()
+                shortfall = self._shortfall(waiter)
+                if self._queue[0] is waiter and shortfall == 0:
+                    heapq.heappop(self._queue)
+                    if self.rpm:
+                        self._requests_left -= waiter.requests
+                    if self.tpm:
+                        self._tokens_left -= waiter.tokens
+                    self.admitted[priority] = self.admitted.get(priority, 0) + 1
+                    self._cond.notify_all()
+                    return waiter
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._drop(waiter)
+                    self.rejected[priority] = self.rejected.get(priority, 0) + 1
+                    raise Overloaded()
+                self._cond.wait(min(remaining, shortfall) if self._queue[0] is waiter else remaining)
+
+    def _drop(self, waiter):
+        self._queue.remove(waiter)
+        heapq.heapify(self._queue)
+        self._cond.notify_all()
+
+    # Gives back the reservation; the actual spend was charged by _refill meanwhile
+    def release(self, waiter):
+        with self._cond:
+            self._refill()
+            if self.rpm:
+                self._requests_left = min(self.rpm, self._requests_left + waiter.requests)
+            if self.tpm:
+                self._tokens_left = min(self.tpm, self._tokens_left + waiter.tokens)
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, priority, requests=1, tokens=0):
+        waiter = self.acquire(priority, requests, tokens)
+        try:
+            yield waiter
+        finally:
+            self.release(waiter)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queue_depth": len(self._queue),
+                "admitted": dict(self.admitted),
+                "rejected": dict(self.rejected)
+            }
+
+
+def priority_for(intent):
+    return PRIORITIES.get(intent, DEFAULT_PRIORITY)
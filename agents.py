@@ -0,0 +1,174 @@
+import threading
+
+# Every Cheeko agent, by the name intent rules route to. Nothing here imports crewai
+# or builds an LLM client: an agent is constructed the first time it is asked for.
+# "context_tokens" caps the history context in its prompts (see context_builder).
+AGENT_SPECS = {
+    "root_kids_agent": {
+        "role": "Central Decision Maker",
+        "goal": "Route tasks to agents for safe, fun chats",
+        "backstory": "Cheeko's brain, picking the best buddy for kids' chats.",
+        # Routing needs only the gist
+        "context_tokens": 60
+    },
+    "inappropriate_filter_agent": {
+        "role": "Content Safety Guardian",
+        "goal": "Keep chats safe for kids",
+        "backstory": "Cheeko's protector, ensuring kid-friendly messages."
+    },
+    "overuse_monitor_agent": {
+        "role": "Screen Time Manager",
+        "goal": "Encourage healthy chat habits",
+        "backstory": "Cheeko's guide, promoting breaks for kids."
+    },
+    "help_escalation_agent": {
+        "role": "Parental Support Coordinator",
+        "goal": "Log issues and alert parents when needed",
+        "backstory": "Cheeko's helper, connecting kids to parents."
+    },
+    "greetings_agent": {
+        "role": "Welcome Buddy",
+        "goal": "Greet kids warmly",
+        "backstory": "Cheeko’s pal, spreading smiles with hellos.",
+        "context_tokens": 60
+    },
+    "chit_chat_agent": {
+        "role": "Playful Conversationalist",
+        "goal": "Chat about kids' interests",
+        "backstory": "Cheeko’s buddy, loving talks about fun stuff."
+    },
+    "bedtime_story_agent": {
+        "role": "Magical Storyteller",
+        "goal": "Tell tailored bedtime stories",
+        "backstory": "Cheeko’s storyteller, weaving dreamy tales.",
+        # Stories benefit from more of what was told before
+        "context_tokens": 300
+    },
+    "math_quiz_agent": {
+        "role": "Math Adventure Guide",
+        "goal": "Make math fun with quizzes",
+        "backstory": "Cheeko’s math toy, cheering for answers.",
+        "context_tokens": 100
+    },
+    "emotional_checkin_agent": {
+        "role": "Kind Listener",
+        "goal": "Support kids’ feelings",
+        "backstory": "Cheeko’s cuddly friend, always listening."
+    },
+    # Not routed to: folds old chats into the rolling summary in the background
+    "summarizer_agent": {
+        "role": "Memory Keeper",
+        "goal": "Remember what matters from a kid's past chats in a few words",
+        "backstory": "Cheeko’s notebook, jotting down favorites and moods.",
+        "context_tokens": 400
+    }
+}
+SPECS_BY_ROLE = {spec["role"]: spec for spec in AGENT_SPECS.values()}
+
+_llm = None
+_agents = {}
+_lock = threading.Lock()
+
+
+def role(name):
+    return AGENT_SPECS[name]["role"]
+
+
+def get_llm():
+    global _llm
+    if _llm is None:
+        with _lock:
+            if _llm is None:
+                from llm_backend import create_llm
+                from metrics import watch_crewai_events
+                watch_crewai_events()
+                # Streaming lets /send_message_stream forward tokens; blocking kickoffs still get the full text
+                _llm = create_llm(stream=True)
+    return _llm
+
+
+# Cumulative (calls, tokens) spent by the shared LLM so far
+def llm_usage():
+    if _llm is None:
+        return 0, 0
+    usage = _llm.get_token_usage_summary()
+    return usage.successful_requests, usage.total_tokens
+
+
+def build_agent(spec, llm):
+    from crewai import Agent
+    return Agent(role=spec["role"], goal=spec["goal"], backstory=spec["backstory"], llm=llm, verbose=True)
+
+
+# The shared agent for a name. Tasks are created against it, but it is never run
+# directly: build_crew and isolate_agents swap in a per-request copy first.
+def get_agent(name):
+    agent = _agents.get(name)
+    if agent is None:
+        llm = get_llm()
+        with _lock:
+            agent = _agents.get(name)
+            if agent is None:
+                agent = _agents[name] = build_agent(AGENT_SPECS[name], llm)
+    return agent
+
+
+# crewai agents keep their executor on the Agent and refuse to run two tasks at once,
+# so concurrent requests can't share them. Each request's tasks get fresh agents built
+# from the same spec around the same LLM client; that is cheaper than Agent.copy(),
+# which also copies the LLM.
+def isolate_agents(tasks):
+    copies = {}
+    for task in tasks:
+        shared = task.agent
+        if id(shared) not in copies:
+            spec = SPECS_BY_ROLE.get(shared.role)
+            copies[id(shared)] = build_agent(spec, shared.llm) if spec else shared.copy()
+        task.agent = copies[id(shared)]
+    return list(copies.values())
+
+
+# crewai saves every task's output to a shared SQLite file for its `crewai replay`
+# command, wiping and rewriting it on each kickoff. That costs ~100 ms of fsyncs per
+# crew, on the event loop under akickoff(), which serialized every ASGI request behind
+# it. Cheeko never replays crews that way, so its crews keep nothing.
+class NoTaskOutputs:
+    def update(self, task_index, log):
+        pass
+
+    def add(self, task, output, task_index, inputs=None, was_replayed=False):
+        pass
+
+    def reset(self):
+        pass
+
+    def load(self):
+        return None
+
+
+_crew_class = None
+
+
+def crew_class():
+    global _crew_class
+    if _crew_class is None:
+        from crewai import Crew
+        from pydantic import PrivateAttr
+
+        class CheekoCrew(Crew):
+            _task_output_handler: NoTaskOutputs = PrivateAttr(default_factory=NoTaskOutputs)
+
+        _crew_class = CheekoCrew
+    return _crew_class
+
+
+# A Crew of its own for each request's tasks
+def build_crew(tasks, **kwargs):
+    return crew_class()(agents=isolate_agents(tasks), tasks=tasks, verbose=True, **kwargs)
+
+
+# Builds everything up front. Called from gunicorn's master before it forks (see
+# gunicorn.conf.py), so workers start with crewai loaded and share those pages.
+def prewarm():
+    for name in AGENT_SPECS:
+        get_agent(name)
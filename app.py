@@ -1,12 +1,32 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, session, stream_with_context
 import json
+import logging
+import os
 import time
-from crewai import Agent, Task, Crew, LLM
 import re
+import uuid
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from agents import AGENT_SPECS, SPECS_BY_ROLE, build_crew, get_agent, isolate_agents, llm_usage, role
 from datetime import datetime
 import pytz
-
+from session_store import create_session_store, MAX_HISTORY
+from durable_log import PARENTAL_EVENT_TYPES, create_conversation_log, create_parental_log
+from history import append_history, clear_history, search_history
+from context_builder import CHARS_PER_TOKEN, DEFAULT_CONTEXT_TOKENS, HistoryContext, clip, estimate_tokens
+from response_cache import FILLER_WORDS, SemanticCache, normalize_input, wants_fresh
+from intent_engine import IntentEngine, load_intent_rules
+from singleflight import SingleFlight
+from admission import BACKGROUND_PRIORITY, AdmissionController, Overloaded, priority_for
+from story_pool import StoryPool
+from summarizer import ConversationSummarizer
+from metrics import TRACE_HEADER, collectors, current_trace, end_trace, render_metrics, set_intent, start_trace, timed_stage
+
+logger = logging.getLogger("cheeko.app")
 app = Flask(__name__)
+# Must be shared by all workers so any of them can read the session cookie
+app.secret_key = os.environ.get("CHEEKO_SECRET_KEY") or os.urandom(24)
 def datetimeformat(value):
     try:
         # Convert Unix timestamp to IST datetime
@@ -17,155 +37,128 @@ def datetimeformat(value):
         return "Unknown time"
 
 app.jinja_env.filters['datetimeformat'] = datetimeformat
-# Initialize LLM
-llm = LLM(
-    model="groq/llama-3.3-70b-versatile",
-    temperature=0.5,
-    max_completion_tokens=1024,
-    top_p=0.9,
-    stop=None,
-    stream=False,
-)
-
-# Session and user tracking
-session_start_time = time.time()
-interaction_count = 0
-user_profile = {"name": "", "age": 7, "favorite_theme": ""}
-points = 0
-parental_log = []
-chat_history = []
-MAX_HISTORY = 20
-
-# Define agents with Cheeko branding
-root_kids_agent = Agent(
-    role="Central Decision Maker",
-    goal="Route tasks to agents for safe, fun chats",
-    backstory="Cheeko's brain, picking the best buddy for kids' chats.",
-    llm=llm,
-    verbose=True
-)
-
-inappropriate_filter_agent = Agent(
-    role="Content Safety Guardian",
-    goal="Keep chats safe for kids",
-    backstory="Cheeko's protector, ensuring kid-friendly messages.",
-    llm=llm,
-    verbose=True
-)
-
-overuse_monitor_agent = Agent(
-    role="Screen Time Manager",
-    goal="Encourage healthy chat habits",
-    backstory="Cheeko's guide, promoting breaks for kids.",
-    llm=llm,
-    verbose=True
-)
-
-help_escalation_agent = Agent(
-    role="Parental Support Coordinator",
-    goal="Log issues and alert parents when needed",
-    backstory="Cheeko's helper, connecting kids to parents.",
-    llm=llm,
-    verbose=True
-)
-
-greetings_agent = Agent(
-    role="Welcome Buddy",
-    goal="Greet kids warmly",
-    backstory="Cheeko’s pal, spreading smiles with hellos.",
-    llm=llm,
-    verbose=True
-)
-
-chit_chat_agent = Agent(
-    role="Playful Conversationalist",
-    goal="Chat about kids' interests",
-    backstory="Cheeko’s buddy, loving talks about fun stuff.",
-    llm=llm,
-    verbose=True
-)
-
-bedtime_story_agent = Agent(
-    role="Magical Storyteller",
-    goal="Tell tailored bedtime stories",
-    backstory="Cheeko’s storyteller, weaving dreamy tales.",
-    llm=llm,
-    verbose=True
-)
-
-math_quiz_agent = Agent(
-    role="Math Adventure Guide",
-    goal="Make math fun with quizzes",
-    backstory="Cheeko’s math toy, cheering for answers.",
-    llm=llm,
-    verbose=True
+# "fast" runs only the specialized agent, relying on the Python guards above it;
+# "strict" also runs the LLM-backed safety, overuse, escalation and routing agents
+PIPELINE_MODE = os.environ.get("CHEEKO_PIPELINE_MODE", "fast")
+if PIPELINE_MODE not in ("fast", "strict"):
+    raise ValueError(f"Unknown pipeline mode: {PIPELINE_MODE}")
+
+# Intents whose replies depend only on the input and profile, with cache TTL in seconds
+CACHEABLE_INTENTS = {"greeting": 600, "math_quiz": 120}
+# Reworded asks hit the reply cached for the original: "math quiz please" gets the
+# quiz cached for "let's do a math quiz", "hello cheeko!" the greeting for "hello"
+response_cache = SemanticCache(
+    int(os.environ.get("CHEEKO_RESPONSE_CACHE_SIZE", "1024")),
+    float(os.environ.get("CHEEKO_RESPONSE_CACHE_SIMILARITY", "0.8"))
 )
 
-emotional_checkin_agent = Agent(
-    role="Kind Listener",
-    goal="Support kids’ feelings",
-    backstory="Cheeko’s cuddly friend, always listening.",
-    llm=llm,
-    verbose=True
-)
+# "math quiz again" wants a new question, so it neither reads nor fills the cache
+def cacheable(intent, user_input):
+    return intent in CACHEABLE_INTENTS and not wants_fresh(user_input)
+
+# Only replies for the same intent and child are shared. Numbers must match exactly,
+# since "what is 2 plus 2" and "what is 3 plus 3" read alike but want different answers.
+def response_cache_scope(state, intent, user_input):
+    user_profile = state["user_profile"]
+    numbers = tuple(re.findall(r"\d+", user_input))
+    return (intent, user_profile['name'], user_profile['favorite_theme'], user_profile['age'], numbers)
+
+def response_cache_metrics():
+    lines = ["# HELP cheeko_response_cache_requests_total Response cache lookups by intent and result.",
+             "# TYPE cheeko_response_cache_requests_total counter"]
+    stats = response_cache.stats()
+    for intent, counts in sorted(stats["intents"].items()):
+        lines.append(f'cheeko_response_cache_requests_total{{intent="{intent}",result="hit"}} {counts["hits"]}')
+        lines.append(f'cheeko_response_cache_requests_total{{intent="{intent}",result="miss"}} {counts["misses"]}')
+    lines += ["# HELP cheeko_response_cache_entries Replies held in the response cache.",
+              "# TYPE cheeko_response_cache_entries gauge",
+              f"cheeko_response_cache_entries {stats['entries']}"]
+    return lines
+
+collectors.append(response_cache_metrics)
+
+# Session and user tracking, keyed per child
+session_store = create_session_store()
+
+# Every history entry is also appended to disk, behind the request
+conversation_log = create_conversation_log()
+parental_log = create_parental_log()
+
+def current_session():
+    if "sid" not in session:
+        session["sid"] = uuid.uuid4().hex
+    return session["sid"], session_store.get(session["sid"])
+
+# Agents come from the registry in agents.py and are built on first use
+def context_budget(agent):
+    return SPECS_BY_ROLE.get(agent.role, {}).get("context_tokens", DEFAULT_CONTEXT_TOKENS)
+
+# Keyword lists compile to one alternation each, so a string is scanned once
+INAPPROPRIATE_KEYWORDS = ["adult", "mature", "violent", "explicit"]
+EMOTIONAL_TRIGGERS = ["sad", "scared", "angry", "lonely"]
+inappropriate_pattern = re.compile("|".join(map(re.escape, INAPPROPRIATE_KEYWORDS)), re.IGNORECASE)
+emotional_pattern = re.compile("|".join(map(re.escape, EMOTIONAL_TRIGGERS)), re.IGNORECASE)
 
 # Chat History Management
-def add_to_history(user_input, intent, output):
-    global chat_history
+def history_entry(user_input, intent, output, timestamp=None):
     output_str = str(output) if hasattr(output, 'raw') else output
-    chat_history.append({
-        "timestamp": time.time(),
+    return {
+        "timestamp": time.time() if timestamp is None else timestamp,
         "input": user_input,
         "intent": intent,
-        "output": output_str
-    })
-    if len(chat_history) > MAX_HISTORY:
-        chat_history = chat_history[-MAX_HISTORY:]
-    notify_parent(f"Logged: {user_input[:50]}... (Intent: {intent})")
-
-def get_relevant_history(user_input):
-    relevant = []
-    for entry in chat_history:
-        if any(keyword in user_input.lower() for keyword in entry["input"].lower().split()) or \
-           any(keyword in user_input.lower() for keyword in entry["intent"].lower().split()):
-            relevant.append(entry)
-    return relevant[:3]
+        "output": output_str,
+        # Classified once here so the checks below never rescan history
+        "flags": {
+            "unsafe": bool(inappropriate_pattern.search(user_input) or inappropriate_pattern.search(output_str)),
+            "emotional": bool(emotional_pattern.search(user_input))
+        }
+    }
+
+@timed_stage("add_to_history")
+def add_to_history(sid, state, user_input, intent, output):
+    entry = history_entry(user_input, intent, output)
+    evicted = append_history(state, entry, MAX_HISTORY)
+    conversation_log.append(sid, entry)
+    summarizer.fold(sid, evicted)
+    notify_parent(sid, "message", f"Logged: {user_input[:50]}... (Intent: {intent})")
+
+def get_relevant_history(state, user_input):
+    return search_history(state, user_input)
 
 # Safety and Compliance Functions
-def safety_check(user_input):
-    inappropriate_keywords = ["adult", "mature", "violent", "explicit"]
-    for keyword in inappropriate_keywords:
-        if keyword in user_input.lower():
-            return False, "Cheeko says that’s not safe! Try a story!"
-    for entry in get_relevant_history(user_input):
-        if any(keyword in entry["input"].lower() or keyword in entry["output"].lower() for keyword in inappropriate_keywords):
+@timed_stage("safety_check")
+def safety_check(state, user_input):
+    if inappropriate_pattern.search(user_input):
+        return False, "Cheeko says that’s not safe! Try a story!"
+    for entry in get_relevant_history(state, user_input):
+        if entry["flags"]["unsafe"]:
             return False, "Cheeko can’t use that chat. What’s next?"
     return True, "Content is safe."
 
-def overuse_check(age):
-    global interaction_count, session_start_time
-    interaction_count += 1
-    elapsed_time = time.time() - session_start_time
+@timed_stage("overuse_check")
+def overuse_check(sid, state, age):
+    state["interaction_count"] += 1
+    interaction_count = state["interaction_count"]
+    elapsed_time = time.time() - state["session_start_time"]
     max_interactions = 15 if age >= 8 else 10
     max_session_time = 3600 if age >= 8 else 1800
     if interaction_count > max_interactions or elapsed_time > max_session_time:
-        notify_parent(f"Exceeded limits: {interaction_count} interactions, {elapsed_time}s")
+        notify_parent(sid, "overuse", f"Exceeded limits: {interaction_count} interactions, {elapsed_time}s")
         return False, "Cheeko says take a break or get a parent!"
     return True, "Usage within limits."
 
-def escalation_check(user_input):
-    emotional_triggers = ["sad", "scared", "angry", "lonely"]
-    if any(trigger in user_input.lower() for trigger in emotional_triggers):
-        notify_parent(f"Escalation: {user_input}")
+@timed_stage("escalation_check")
+def escalation_check(sid, state, user_input):
+    if emotional_pattern.search(user_input):
+        notify_parent(sid, "escalation", f"Escalation: {user_input}")
         return True, "Cheeko hears you’re down. Parent or story?"
-    emotional_count = sum(1 for entry in chat_history if any(trigger in entry["input"].lower() for trigger in emotional_triggers))
-    if emotional_count >= 3:
-        notify_parent("Multiple emotional triggers in history")
+    if state["flag_counts"].get("emotional", 0) >= 3:
+        notify_parent(sid, "escalation", "Multiple emotional triggers in history")
         return True, "Cheeko’s worried! Parent or fun activity?"
     return False, "No escalation needed."
 
-def notify_parent(message):
-    parental_log.append({"timestamp": time.time(), "message": message})
+def notify_parent(sid, event_type, message):
+    parental_log.record(sid, event_type, message)
 
 # Personalization and Engagement
 def adjust_tone(response, age):
@@ -173,57 +166,58 @@ def adjust_tone(response, age):
         return response.replace("interesting", "super fun").replace("let's try", "wanna play")
     return response
 
-def reward_child(task_output, intent):
-    global points
+@timed_stage("reward_child")
+def reward_child(state, task_output, intent):
     output_str = str(task_output) if hasattr(task_output, 'raw') else task_output
     if intent in ["math_quiz", "riddle"]:
-        points += 10
-        quiz_history = [entry for entry in chat_history if entry["intent"] == "math_quiz"]
+        state["points"] += 10
+        quiz_history = [entry for entry in state["chat_history"] if entry["intent"] == "math_quiz"]
         if quiz_history:
-            output_str += f"\nGreat quizzes before, {user_profile['name']}!"
-        return f"{output_str}\nYay! Cheeko gives 10 points (Total: {points}). Fun fact?"
+            output_str += f"\nGreat quizzes before, {state['user_profile']['name']}!"
+        return f"{output_str}\nYay! Cheeko gives 10 points (Total: {state['points']}). Fun fact?"
     return output_str
 
-def prompt_preferences(name, theme):
-    user_profile.update({"name": name, "favorite_theme": theme})
+def prompt_preferences(state, name, theme):
+    state["user_profile"].update({"name": name, "favorite_theme": theme})
     return f"Yay, {name}! Cheeko’s excited to chat about {theme}!"
 
 # Intent Detection
-def detect_intent(user_input):
-    user_input = user_input.lower().strip()
-    intents = {
-        "bedtime_story": ["bedtime story", "story for sleep", "sotry", "sleepy"],
-        "math_quiz": ["math", "quiz", "numbers"],
-        "emotional_checkin": ["feeling", "sad", "happy", "scared"],
-        "chit_chat": []
-    }
-    relevant_history = get_relevant_history(user_input)
-    context = f"Previous chats: {json.dumps(relevant_history, indent=2)}" if relevant_history else "No relevant history."
+intent_engine = IntentEngine(load_intent_rules())
 
-    greeting_pattern = re.compile(r"^\s*(hi|hai|hey|hiya|hello|hellow|greet|yo|howdy)\b", re.IGNORECASE)
-    if greeting_pattern.match(user_input):
-        try:
-            agent = globals()["greetings_agent"]
-            task_description = f"Greet for: '{user_input}'. Context: {context}. Greet {user_profile['name']} as Cheeko, mention {user_profile['favorite_theme']}."
-            return "greeting", agent, task_description, "Cheeko’s friendly greeting"
-        except KeyError:
-            return "fallback", chit_chat_agent, f"Chat for: '{user_input}'. Context: {context}", "Cheeko’s friendly reply"
-
-    for intent, keywords in intents.items():
-        if any(keyword in user_input for keyword in keywords):
-            try:
-                agent = globals()[f"{intent}_agent"]
-                task_description = f"Handle {intent} for: '{user_input}'. Context: {context}. Respond as Cheeko."
-                if intent == "bedtime_story":
-                    task_description += f" Include {user_profile['name']} and {user_profile['favorite_theme']}."
-                    if "who is" in user_input and any(entry["intent"] == "bedtime_story" for entry in relevant_history):
-                        task_description += f" Assume character from past {user_profile['favorite_theme']} story."
-                    elif any(entry["intent"] == "bedtime_story" for entry in relevant_history):
-                        task_description += f" Reference past story: 'Cheeko told about {user_profile['favorite_theme']}, more?'"
-                return intent, agent, task_description, f"Cheeko’s {intent} reply"
-            except KeyError:
-                return "fallback", chit_chat_agent, f"Chat for: '{user_input}'. Context: {context}. Respond as Cheeko", "Cheeko’s friendly reply"
-    return "fallback", chit_chat_agent, f"Chat for: '{user_input}'. Context: {context}. Respond as Cheeko", "Cheeko’s friendly reply"
+@timed_stage("classify_intent")
+def classify_intent(user_input):
+    intent = intent_engine.match(user_input)
+    if intent is None or intent_engine.agents[intent] not in AGENT_SPECS:
+        return "fallback"
+    return intent
+
+def detect_intent(state, user_input, intent=None, history_context=None):
+    user_profile = state["user_profile"]
+    user_input = user_input.lower().strip()
+    if intent is None:
+        intent = classify_intent(user_input)
+    if history_context is None:
+        history_context = HistoryContext(get_relevant_history(state, user_input))
+    relevant_history = history_context.entries
+
+    if intent == "fallback":
+        agent = get_agent("chit_chat_agent")
+        context = history_context.render(context_budget(agent))
+        return "fallback", agent, f"Chat for: '{user_input}'. Context: {context}. Respond as Cheeko", "Cheeko’s friendly reply"
+    agent = get_agent(intent_engine.agents[intent])
+    context = history_context.render(context_budget(agent))
+    if intent == "greeting":
+        task_description = f"Greet for: '{user_input}'. Context: {context}. Greet {user_profile['name']} as Cheeko, mention {user_profile['favorite_theme']}."
+        return "greeting", agent, task_description, "Cheeko’s friendly greeting"
+
+    task_description = f"Handle {intent} for: '{user_input}'. Context: {context}. Respond as Cheeko."
+    if intent == "bedtime_story":
+        task_description += f" Include {user_profile['name']} and {user_profile['favorite_theme']}."
+        if "who is" in user_input and any(entry["intent"] == "bedtime_story" for entry in relevant_history):
+            task_description += f" Assume character from past {user_profile['favorite_theme']} story."
+        elif any(entry["intent"] == "bedtime_story" for entry in relevant_history):
+            task_description += f" Reference past story: 'Cheeko told about {user_profile['favorite_theme']}, more?'"
+    return intent, agent, task_description, f"Cheeko’s {intent} reply"
 
 # Error Handling
 def handle_input(user_input):
@@ -232,53 +226,112 @@ def handle_input(user_input):
     return user_input
 
 # Task Creation
-def create_tasks(user_input):
+@timed_stage("create_tasks")
+def create_tasks(state, user_input, mode=PIPELINE_MODE, intent=None, summary=""):
+    from crewai import Task
+    user_profile = state["user_profile"]
+    # Searched and rendered once, shared by the routing and specialized prompts
+    history_context = HistoryContext(get_relevant_history(state, user_input), summary)
+    intent, agent, task_description, expected_output = detect_intent(state, user_input, intent, history_context)
+    expected_output = adjust_tone(expected_output, user_profile['age'])
+    if mode == "fast":
+        # safety_check, overuse_check and escalation_check already gated this input
+        return [Task(description=task_description, expected_output=expected_output, agent=agent)]
+
     safety_task = Task(
         description=f"Check input: '{user_input}' and history for safety",
-        expected_output="Safety status",
-        agent=inappropriate_filter_agent
+        expected_output=GUARD_VERDICT_FORMAT,
+        agent=get_agent("inappropriate_filter_agent")
     )
     overuse_task = Task(
-        description=f"Check usage for age {user_profile['age']}",
-        expected_output="Usage status",
-        agent=overuse_monitor_agent
+        description=f"Check usage for age {user_profile['age']} after {state['interaction_count']} interactions",
+        expected_output=GUARD_VERDICT_FORMAT,
+        agent=get_agent("overuse_monitor_agent")
     )
     escalation_task = Task(
         description=f"Check if '{user_input}' needs parent",
-        expected_output="Escalation status",
-        agent=help_escalation_agent
+        expected_output=GUARD_VERDICT_FORMAT,
+        agent=get_agent("help_escalation_agent")
     )
-    intent, agent, task_description, expected_output = detect_intent(user_input)
+    route_agent = get_agent("root_kids_agent")
     route_task = Task(
-        description=f"Route input: '{user_input}' to {intent}. Context: {json.dumps(get_relevant_history(user_input), indent=2)}",
+        description=f"Route input: '{user_input}' to {intent}. Context: {history_context.render(context_budget(route_agent))}",
         expected_output=f"Routed to {intent}",
-        agent=root_kids_agent,
-        dependencies=[safety_task, overuse_task, escalation_task]
+        agent=route_agent,
+        context=[safety_task, overuse_task, escalation_task]
     )
     specialized_task = Task(
         description=task_description,
-        expected_output=adjust_tone(expected_output, user_profile['age']),
-        agent=agent,
-        dependencies=[route_task]
+        expected_output=expected_output,
+        agent=agent
     )
     return [safety_task, overuse_task, escalation_task, route_task, specialized_task]
 
-# Create Crew
-crew = Crew(
-    agents=[
-        root_kids_agent, inappropriate_filter_agent, overuse_monitor_agent, help_escalation_agent,
-        greetings_agent, chit_chat_agent, bedtime_story_agent, math_quiz_agent, emotional_checkin_agent
-    ],
-    tasks=[],
-    verbose=True
-)
+# Strict-mode guards are independent of each other, so they run side by side
+GUARD_VERDICT_FORMAT = "PASS or FAIL, then a short reason"
+
+# Guards fail closed: only a reply whose first word is PASS, once markdown and
+# punctuation are stripped, lets the message through
+def guard_passed(result):
+    words = re.findall(r"[A-Za-z]+", str(result))
+    return bool(words) and words[0].upper() == "PASS"
+GUARD_REPLIES = {
+    role("inappropriate_filter_agent"): ("Cheeko says that’s not safe! Try a story!", False),
+    role("overuse_monitor_agent"): ("Cheeko says take a break or get a parent!", False),
+    role("help_escalation_agent"): ("Cheeko hears you’re down. Parent or story?", True)
+}
+guard_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("CHEEKO_GUARD_WORKERS", "12")))
+
+# The admission reservation covers every guard's LLM call, so it is handed back only
+# once the last guard has finished, not when the first FAIL lets the request move on
+@timed_stage("run_guard_tasks")
+def run_guard_tasks(guard_tasks, reservation):
+    isolate_agents(guard_tasks)
+    # Each guard runs in the request's context, so its metrics carry the request's trace
+    futures = {guard_executor.submit(contextvars.copy_context().run, task.execute_sync): task for task in guard_tasks}
+    running = [len(futures)]
+    running_lock = threading.Lock()
+
+    def guard_done(_):
+        with running_lock:
+            running[0] -= 1
+            if running[0]:
+                return
+        admission.release(reservation)
+
+    for future in futures:
+        future.add_done_callback(guard_done)
+    for future in as_completed(futures):
+        if not guard_passed(future.result()):
+            # Don't wait on the other guards once one has failed
+            for pending in futures:
+                pending.cancel()
+            return futures[future]
+    return None
+
+# Request tracing: callers may pass their own trace ID, and every response echoes it
+@app.before_request
+def begin_trace():
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    start_trace(route, request.headers.get(TRACE_HEADER))
+
+@app.after_request
+def finish_trace(response):
+    trace = current_trace.get()
+    if trace is not None:
+        response.headers[TRACE_HEADER] = trace.trace_id
+        # Runs once the body is fully sent, so streamed replies are timed to the last token
+        response.call_on_close(lambda: end_trace(trace, response.status_code))
+    return response
 
 # Flask Routes
 @app.route('/')
 def index():
+    sid, state = current_session()
+    user_profile = state["user_profile"]
     if not user_profile['name']:
         return render_template('onboarding.html')
-    return render_template('chat.html', name=user_profile['name'], theme=user_profile['favorite_theme'], chat_history=chat_history)
+    return render_template('chat.html', name=user_profile['name'], theme=user_profile['favorite_theme'], chat_history=state["chat_history"])
 
 @app.route('/setup', methods=['POST'])
 def setup():
@@ -286,67 +339,366 @@ def setup():
     theme = request.form.get('theme', '').strip()
     if not name or not theme:
         return jsonify({'error': 'Please tell Cheeko your name and favorite thing!'}), 400
-    welcome_message = prompt_preferences(name, theme)
-    add_to_history('', 'greeting', welcome_message)
+    sid, state = current_session()
+    welcome_message = prompt_preferences(state, name, theme)
+    add_to_history(sid, state, '', 'greeting', welcome_message)
+    session_store.save(sid, state)
+    story_pool.refill(story_key(state))
     return jsonify({'redirect': '/chat'})
 
 @app.route('/chat', methods=['GET'])
 def chat():
+    sid, state = current_session()
+    user_profile = state["user_profile"]
     if not user_profile['name']:
         return jsonify({'redirect': '/'}), 403
-    return render_template('chat.html', name=user_profile['name'], theme=user_profile['favorite_theme'], chat_history=chat_history)
+    return render_template('chat.html', name=user_profile['name'], theme=user_profile['favorite_theme'], chat_history=state["chat_history"])
+
+# Outbound LLM budget shared by every request in this worker; set the limits to the
+# Groq plan's (0 = unlimited). Urgent intents jump the queue when it backs up.
+admission = AdmissionController(
+    int(os.environ.get("CHEEKO_LLM_RPM", "0")),
+    int(os.environ.get("CHEEKO_LLM_TPM", "0")),
+    int(os.environ.get("CHEEKO_LLM_MAX_QUEUE", "64")),
+    float(os.environ.get("CHEEKO_LLM_MAX_WAIT", "10")),
+    usage=llm_usage
+)
+# Reply length reserved per task until the real usage is known
+ESTIMATED_REPLY_TOKENS = 300
+THINKING_REPLY = "Cheeko is thinking really hard! Ask me again in a moment."
+ERROR_REPLY = "Oops, Cheeko got mixed up! Can you say that again?"
+
+# (priority, calls, tokens) to reserve for running these tasks
+def admission_request(intent, tasks):
+    return priority_for(intent), len(tasks), sum(estimate_tokens(task.description) + ESTIMATED_REPLY_TOKENS for task in tasks)
+
+def thinking_reply():
+    return {'messages': [{'sender': 'Cheeko', 'text': THINKING_REPLY, 'timestamp': datetime.now().strftime('%H:%M')}], 'degraded': True}
+
+# For a streamed reply that already sent its headers, so a failure can't become a 500
+def error_reply():
+    return {'messages': [{'sender': 'Cheeko', 'text': ERROR_REPLY, 'timestamp': datetime.now().strftime('%H:%M')}], 'error': True}
+
+def admission_metrics():
+    stats = admission.stats()
+    lines = ["# HELP cheeko_llm_queue_depth Requests waiting for LLM budget.",
+             "# TYPE cheeko_llm_queue_depth gauge",
+             f"cheeko_llm_queue_depth {stats['queue_depth']}",
+             "# HELP cheeko_llm_admissions_total Requests admitted to or turned away from the LLM, by priority.",
+             "# TYPE cheeko_llm_admissions_total counter"]
+    for outcome in ("admitted", "rejected"):
+        for priority, count in sorted(stats[outcome].items()):
+            lines.append(f'cheeko_llm_admissions_total{{priority="{priority}",outcome="{outcome}"}} {count}')
+    return lines
+
+collectors.append(admission_metrics)
+
+# Bedtime stories are the slowest replies, so a few per child are written ahead of
+# time in the background, after /setup and whenever one is served
+def story_key(state):
+    return state["user_profile"]['name'], state["user_profile"]['favorite_theme']
+
+BEDTIME_WORDS = {"bedtime", "story", "stories", "for", "sleep", "sleepy", "sotry", "time", "tonight", "night"}
+
+# Pooled stories are written from the generic prompt in generate_story, so they only
+# answer a plain "tell me a bedtime story". An ask with anything more ("about a brave
+# turtle", "who is the dragon") or a child who already heard a story this session,
+# whose prompt references it, takes the live prompt.
+def pooled_story_fits(state, user_input):
+    words = set(normalize_input(user_input).split())
+    if not words <= BEDTIME_WORDS | FILLER_WORDS:
+        return False
+    return not any(entry["intent"] == "bedtime_story" for entry in state["chat_history"])
+
+def generate_story(key):
+    from crewai import Task
+    name, theme = key
+    task = Task(
+        description=f"Handle bedtime_story for: 'tell me a bedtime story'. Respond as Cheeko. Include {name} and {theme}.",
+        expected_output="Cheeko’s bedtime_story reply",
+        agent=get_agent("bedtime_story_agent")
+    )
+    try:
+        with admission.admit(BACKGROUND_PRIORITY, 1, estimate_tokens(task.description) + ESTIMATED_REPLY_TOKENS):
+            return str(build_crew([task]).kickoff())
+    except Overloaded:
+        return None
+
+story_pool = StoryPool(
+    generate_story,
+    int(os.environ.get("CHEEKO_STORY_POOL_SIZE", "2")),
+    float(os.environ.get("CHEEKO_STORY_TTL", "21600")),
+    int(os.environ.get("CHEEKO_STORY_POOL_CHILDREN", "1000")),
+    refresh=float(os.environ.get("CHEEKO_STORY_REFRESH", "0")) or None
+)
 
-@app.route('/send_message', methods=['POST'])
-def send_message():
-    user_input = request.form.get('message', '')
+def story_pool_metrics():
+    stats = story_pool.stats()
+    return ["# HELP cheeko_story_pool_requests_total Bedtime requests served from or missing the story pool.",
+            "# TYPE cheeko_story_pool_requests_total counter",
+            f'cheeko_story_pool_requests_total{{result="hit"}} {stats["hits"]}',
+            f'cheeko_story_pool_requests_total{{result="miss"}} {stats["misses"]}',
+            "# HELP cheeko_story_pool_stories Pre-generated stories waiting to be told.",
+            "# TYPE cheeko_story_pool_stories gauge",
+            f"cheeko_story_pool_stories {stats['stories']}"]
+
+collectors.append(story_pool_metrics)
+
+# Entries that fall out of the history window are folded into a short per-child
+# summary in the background, so prompts keep long-range context at a fixed cost
+SUMMARY_TOKENS = int(os.environ.get("CHEEKO_SUMMARY_TOKENS", "120"))
+
+def summarize_history(summary, entries):
+    from crewai import Task
+    agent = get_agent("summarizer_agent")
+    task = Task(
+        description=(
+            f"Update what Cheeko remembers about this child. Current notes: {summary or 'none yet'}. "
+            f"Fold in these older chats:\n{HistoryContext(entries).render(context_budget(agent))}\n"
+            f"Keep favorites, moods and anything a parent flagged; drop small talk. At most {SUMMARY_TOKENS * 3 // 4} words."
+        ),
+        expected_output="The updated notes, one short paragraph",
+        agent=agent
+    )
+    try:
+        with admission.admit(BACKGROUND_PRIORITY, 1, estimate_tokens(task.description) + SUMMARY_TOKENS):
+            return clip(str(build_crew([task]).kickoff()), SUMMARY_TOKENS * CHARS_PER_TOKEN)
+    except Overloaded:
+        return None
+
+summarizer = ConversationSummarizer(
+    summarize_history,
+    os.environ.get("CHEEKO_SUMMARY_DB", os.environ.get("CHEEKO_HISTORY_LOG", "cheeko_history.db")),
+    batch_size=int(os.environ.get("CHEEKO_SUMMARY_BATCH", "5"))
+)
+
+# Message Pipeline
+# Returns (reply, None, intent) when the message is answered without the crew, else (None, tasks, intent)
+def prepare_message(sid, state, user_input):
     user_input = handle_input(user_input)
     if user_input.lower() == 'exit':
-        return jsonify({'error': 'Session ended'}), 200
+        return {'error': 'Session ended'}, None, None
     if isinstance(user_input, str) and "didn’t hear you" in user_input:
-        return jsonify({'messages': [{'sender': 'Cheeko', 'text': user_input, 'timestamp': datetime.now().strftime('%H:%M')}]})
+        return {'messages': [{'sender': 'Cheeko', 'text': user_input, 'timestamp': datetime.now().strftime('%H:%M')}]}, None, None
     
-    is_safe, safety_message = safety_check(user_input)
+    is_safe, safety_message = safety_check(state, user_input)
     if not is_safe:
-        return jsonify({'messages': [{'sender': 'Cheeko', 'text': safety_message, 'timestamp': datetime.now().strftime('%H:%M')}]})
+        set_intent("unsafe")
+        return {'messages': [{'sender': 'Cheeko', 'text': safety_message, 'timestamp': datetime.now().strftime('%H:%M')}]}, None, None
     
-    is_within_limits, overuse_message = overuse_check(user_profile['age'])
+    is_within_limits, overuse_message = overuse_check(sid, state, state["user_profile"]['age'])
+    session_store.save(sid, state)
     if not is_within_limits:
-        return jsonify({'messages': [{'sender': 'Cheeko', 'text': overuse_message, 'timestamp': datetime.now().strftime('%H:%M')}]})
+        set_intent("overuse")
+        return {'messages': [{'sender': 'Cheeko', 'text': overuse_message, 'timestamp': datetime.now().strftime('%H:%M')}]}, None, None
     
-    needs_escalation, escalation_message = escalation_check(user_input)
+    needs_escalation, escalation_message = escalation_check(sid, state, user_input)
     if needs_escalation:
-        return jsonify({
+        set_intent("escalation")
+        return {
             'messages': [{'sender': 'Cheeko', 'text': escalation_message, 'timestamp': datetime.now().strftime('%H:%M')}],
             'escalation': True
-        })
+        }, None, None
     
-    crew.tasks = create_tasks(user_input)
-    result = crew.kickoff()
-    intent = detect_intent(user_input)[0]
-    final_output = reward_child(result, intent)
-    add_to_history(user_input, intent, final_output)
+    intent = classify_intent(user_input)
+    set_intent(intent)
+    if cacheable(intent, user_input):
+        cached_output = response_cache.get(response_cache_scope(state, intent, user_input), user_input)
+        if cached_output is not None:
+            return finish_message(sid, state, user_input, intent, cached_output), None, intent
+    if intent == "bedtime_story" and pooled_story_fits(state, user_input):
+        story = story_pool.take(story_key(state))
+        if story is not None:
+            return finish_message(sid, state, user_input, intent, story), None, intent
     
-    return jsonify({
+    tasks = create_tasks(state, user_input, intent=intent, summary=summarizer.get(sid))
+    if PIPELINE_MODE == "strict":
+        try:
+            failed_task = run_guard_tasks(tasks[:3], admission.acquire(*admission_request(intent, tasks[:3])))
+        except Overloaded:
+            return thinking_reply(), None, intent
+        if failed_task is not None:
+            guard_message, escalation = GUARD_REPLIES[failed_task.agent.role]
+            if escalation:
+                notify_parent(sid, "escalation", f"Escalation: {user_input}")
+            return {
+                'messages': [{'sender': 'Cheeko', 'text': guard_message, 'timestamp': datetime.now().strftime('%H:%M')}],
+                'escalation': escalation
+            }, None, intent
+        tasks = tasks[3:]
+    return None, tasks, intent
+
+def finish_message(sid, state, user_input, intent, result):
+    # Cache hits come back as plain strings; only fresh crew output is stored
+    if cacheable(intent, user_input) and not isinstance(result, str):
+        response_cache.put(response_cache_scope(state, intent, user_input), user_input, str(result), CACHEABLE_INTENTS[intent])
+    final_output = reward_child(state, result, intent)
+    add_to_history(sid, state, user_input, intent, final_output)
+    session_store.save(sid, state)
+    return {
         'messages': [
-            {'sender': user_profile['name'], 'text': user_input, 'timestamp': datetime.now().strftime('%H:%M')},
+            {'sender': state["user_profile"]['name'], 'text': user_input, 'timestamp': datetime.now().strftime('%H:%M')},
             {'sender': 'Cheeko', 'text': final_output, 'timestamp': datetime.now().strftime('%H:%M')}
         ]
-    })
+    }
+
+# Identical in-flight task lists (same agents, same rendered prompts) share one crew run
+SINGLEFLIGHT_TIMEOUT = float(os.environ.get("CHEEKO_SINGLEFLIGHT_TIMEOUT", "30"))
+llm_flight = SingleFlight(SINGLEFLIGHT_TIMEOUT)
+
+def flight_key(tasks):
+    return tuple((task.agent.role, task.description) for task in tasks)
+
+@timed_stage("kickoff_tasks")
+def kickoff_tasks(tasks, intent):
+    # Only the leader spends budget; followers reuse its result, or its Overloaded
+    def run():
+        with admission.admit(*admission_request(intent, tasks)):
+            return build_crew(tasks).kickoff()
+    return llm_flight.do(flight_key(tasks), run)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/send_message', methods=['POST'])
+def send_message():
+    user_input = request.form.get('message', '')
+    sid, state = current_session()
+    reply, tasks, intent = prepare_message(sid, state, user_input)
+    if reply is not None:
+        return jsonify(reply)
+    
+    try:
+        result = kickoff_tasks(tasks, intent)
+    except Overloaded:
+        return jsonify(thinking_reply())
+    return jsonify(finish_message(sid, state, user_input, intent, result))
+
+# Same pipeline as /send_message, but the specialized agent's tokens are pushed as they arrive
+@app.route('/send_message_stream', methods=['POST'])
+def send_message_stream():
+    user_input = request.form.get('message', '')
+    sid, state = current_session()
+    reply, tasks, intent = prepare_message(sid, state, user_input)
+    if reply is not None:
+        return Response(sse_event('done', reply), mimetype='text/event-stream')
+    
+    stream_crew = build_crew(tasks, stream=True)
+    # Stream chunks report task_index 0 for every task, so the reply is picked out by its agent
+    reply_role = tasks[-1].agent.role
+    key = flight_key(tasks)
+
+    def generate():
+        call, is_leader = llm_flight.begin(key)
+        if not is_leader:
+            # Someone is already generating this exact reply; send theirs in one go
+            try:
+                finished, result = llm_flight.wait(call)
+            except Overloaded:
+                # The leader was turned away by admission control; so is this request
+                yield sse_event('done', thinking_reply())
+                return
+            except Exception:
+                logger.exception("The reply this stream was waiting on failed")
+                yield sse_event('done', error_reply())
+                return
+            if finished:
+                yield sse_event('done', finish_message(sid, state, user_input, intent, result))
+                return
+        try:
+            with admission.admit(*admission_request(intent, tasks)):
+                streaming = stream_crew.kickoff()
+                for chunk in streaming:
+                    if chunk.agent_role == reply_role and chunk.content:
+                        yield sse_event('token', {'text': chunk.content})
+        except Overloaded:
+            if is_leader:
+                llm_flight.abort(key, call)
+            yield sse_event('done', thinking_reply())
+            return
+        except BaseException:
+            if is_leader:
+                llm_flight.abort(key, call)
+            raise
+        if is_leader:
+            llm_flight.finish(key, call, result=streaming.result)
+        agent_output = str(streaming.result)
+        reply = finish_message(sid, state, user_input, intent, streaming.result)
+        final_output = reply['messages'][-1]['text']
+        if final_output.startswith(agent_output) and final_output != agent_output:
+            # reward_child's points message
+            yield sse_event('token', {'text': final_output[len(agent_output):]})
+        yield sse_event('done', reply)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/clear_chat', methods=['POST'])
 def clear_chat():
-    global chat_history
-    chat_history.clear()
+    sid, state = current_session()
+    clear_history(state)
+    conversation_log.record_clear(sid)
+    summarizer.clear(sid)
+    session_store.save(sid, state)
     return jsonify({'success': True})
 
+# `before` and `limit` query args for paged routes; raises ValueError on bad input
+MAX_PAGE_SIZE = 200
+
+def history_page(args):
+    try:
+        before = int(args['before']) if args.get('before') else None
+        limit = int(args.get('limit', 50))
+    except ValueError:
+        raise ValueError("before and limit must be integers")
+    return {'before': before, 'limit': max(1, min(limit, MAX_PAGE_SIZE))}
+
+# The full transcript from disk, newest first, including entries cleared from the chat
+@app.route('/history', methods=['GET'])
+def full_history():
+    sid, state = current_session()
+    try:
+        page = history_page(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    entries, next_cursor = conversation_log.read(sid, **page)
+    return jsonify({'entries': entries, 'next_cursor': next_cursor})
+
+# Parent review of alerts, newest first. Optional filters: type (comma separated),
+# since/until (Unix timestamps); pass next_cursor back as `before` for older alerts.
+def parent_alert_filters(args):
+    event_types = [event_type for event_type in args.get('type', '').split(',') if event_type]
+    unknown = set(event_types) - set(PARENTAL_EVENT_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown event type: {', '.join(sorted(unknown))}")
+    since = float(args['since']) if args.get('since') else None
+    until = float(args['until']) if args.get('until') else None
+    return {'event_types': event_types, 'since': since, 'until': until, **history_page(args)}
+
+@app.route('/parent/alerts', methods=['GET'])
+def parent_alerts():
+    sid, state = current_session()
+    try:
+        filters = parent_alert_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    alerts, next_cursor = parental_log.query(sid, **filters)
+    return jsonify({'alerts': alerts, 'next_cursor': next_cursor})
+
 @app.route('/involve_parent', methods=['POST'])
 def involve_parent():
-    add_to_history('', 'escalation', 'Please ask a parent to assist you.')
+    sid, state = current_session()
+    add_to_history(sid, state, '', 'escalation', 'Please ask a parent to assist you.')
+    session_store.save(sid, state)
     return jsonify({'messages': [{'sender': 'Cheeko', 'text': 'Please ask a parent to assist you.', 'timestamp': datetime.now().strftime('%H:%M')}]})
 
 @app.route('/continue_chat', methods=['POST'])
 def continue_chat():
     return jsonify({'success': True})
 
+# Prometheus text exposition; each worker process reports its own counters
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080)
\ No newline at end of file
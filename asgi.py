@@ -0,0 +1,271 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.templating import Jinja2Templates
+
+from app import (
+    SINGLEFLIGHT_TIMEOUT, add_to_history, admission, admission_request, clear_history, conversation_log, datetimeformat,
+    error_reply, finish_message, flight_key, history_page, parent_alert_filters, parental_log, prepare_message, prompt_preferences, session_store,
+    sse_event, story_key, story_pool, summarizer, thinking_reply
+)
+from admission import Overloaded
+from agents import build_crew
+from metrics import TRACE_HEADER, end_trace, render_metrics, start_trace
+from singleflight import AsyncSingleFlight
+
+# Same routes as app.py, but a conversation waiting on the crew doesn't hold a request
+# thread. crewai's akickoff() still runs each blocking LLM call on the event loop's
+# default executor, so that pool caps the LLM calls in flight per process: it is
+# sized by CHEEKO_ASGI_THREADS (default 64) at startup. Everything else that blocks
+# (prepare_message, waiting for LLM budget, every session and log read or write) gets
+# a pool of its own, so a queue of admission waits can never starve the LLM calls or
+# the other way round, and a locked session database never stalls the event loop.
+# Run with: gunicorn asgi:app -c gunicorn.conf.py
+LLM_THREADS = int(os.environ.get("CHEEKO_ASGI_THREADS", "64"))
+# Room for every admission waiter plus the short blocking calls
+blocking_pool = ThreadPoolExecutor(
+    int(os.environ.get("CHEEKO_ASGI_BLOCKING_THREADS", str(admission.max_queue + 16))),
+    thread_name_prefix="cheeko-blocking"
+)
+
+logger = logging.getLogger("cheeko.asgi")
+templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "templates"))
+templates.env.filters['datetimeformat'] = datetimeformat
+llm_flight = AsyncSingleFlight(SINGLEFLIGHT_TIMEOUT)
+
+# Like asyncio.to_thread, including the trace context, but on blocking_pool
+async def run_blocking(func, *args, **kwargs):
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(blocking_pool, call)
+
+async def current_session(request):
+    if "sid" not in request.session:
+        request.session["sid"] = uuid.uuid4().hex
+    sid = request.session["sid"]
+    return sid, await run_blocking(session_store.get, sid)
+
+async def index(request):
+    sid, state = await current_session(request)
+    user_profile = state["user_profile"]
+    if not user_profile['name']:
+        return templates.TemplateResponse(request, 'onboarding.html')
+    return templates.TemplateResponse(request, 'chat.html', {'name': user_profile['name'], 'theme': user_profile['favorite_theme'], 'chat_history': state["chat_history"]})
+
+async def setup(request):
+    form = await request.form()
+    name = form.get('name', '').strip()
+    theme = form.get('theme', '').strip()
+    if not name or not theme:
+        return JSONResponse({'error': 'Please tell Cheeko your name and favorite thing!'}, status_code=400)
+    sid, state = await current_session(request)
+
+    def save():
+        welcome_message = prompt_preferences(state, name, theme)
+        add_to_history(sid, state, '', 'greeting', welcome_message)
+        session_store.save(sid, state)
+        story_pool.refill(story_key(state))
+    await run_blocking(save)
+    return JSONResponse({'redirect': '/chat'})
+
+async def chat(request):
+    sid, state = await current_session(request)
+    user_profile = state["user_profile"]
+    if not user_profile['name']:
+        return JSONResponse({'redirect': '/'}, status_code=403)
+    return templates.TemplateResponse(request, 'chat.html', {'name': user_profile['name'], 'theme': user_profile['favorite_theme'], 'chat_history': state["chat_history"]})
+
+async def send_message(request):
+    form = await request.form()
+    user_input = form.get('message', '')
+    sid, state = await current_session(request)
+    # Strict mode blocks on the guard thread pool, so keep it off the event loop
+    reply, tasks, intent = await run_blocking(prepare_message, sid, state, user_input)
+    if reply is not None:
+        return JSONResponse(reply)
+
+    # Waiting for LLM budget blocks, so it happens on a worker thread
+    async def run():
+        waiter = await run_blocking(admission.acquire, *admission_request(intent, tasks))
+        try:
+            return await build_crew(tasks).akickoff()
+        finally:
+            admission.release(waiter)
+    try:
+        result = await llm_flight.do(flight_key(tasks), run)
+    except Overloaded:
+        return JSONResponse(thinking_reply())
+    return JSONResponse(await run_blocking(finish_message, sid, state, user_input, intent, result))
+
+async def send_message_stream(request):
+    form = await request.form()
+    user_input = form.get('message', '')
+    sid, state = await current_session(request)
+    reply, tasks, intent = await run_blocking(prepare_message, sid, state, user_input)
+    if reply is not None:
+        return StreamingResponse(iter([sse_event('done', reply)]), media_type='text/event-stream')
+
+    # Stream chunks report task_index 0 for every task, so the reply is picked out by its agent
+    reply_role = tasks[-1].agent.role
+    key = flight_key(tasks)
+
+    async def generate():
+        future, is_leader = llm_flight.begin(key)
+        if not is_leader:
+            try:
+                finished, result = await llm_flight.wait(future)
+            except Overloaded:
+                # The leader was turned away by admission control; so is this request
+                yield sse_event('done', thinking_reply())
+                return
+            except Exception:
+                logger.exception("The reply this stream was waiting on failed")
+                yield sse_event('done', error_reply())
+                return
+            if finished:
+                yield sse_event('done', await run_blocking(finish_message, sid, state, user_input, intent, result))
+                return
+        try:
+            waiter = await run_blocking(admission.acquire, *admission_request(intent, tasks))
+            try:
+                stream_crew = build_crew(tasks, stream=True)
+                streaming = await stream_crew.akickoff()
+                async for chunk in streaming:
+                    if chunk.agent_role == reply_role and chunk.content:
+                        yield sse_event('token', {'text': chunk.content})
+            finally:
+                admission.release(waiter)
+        except Overloaded:
+            if is_leader:
+                llm_flight.abort(key, future)
+            yield sse_event('done', thinking_reply())
+            return
+        except BaseException:
+            if is_leader:
+                llm_flight.abort(key, future)
+            raise
+        if is_leader:
+            llm_flight.finish(key, future, result=streaming.result)
+        agent_output = str(streaming.result)
+        reply = await run_blocking(finish_message, sid, state, user_input, intent, streaming.result)
+        final_output = reply['messages'][-1]['text']
+        if final_output.startswith(agent_output) and final_output != agent_output:
+            yield sse_event('token', {'text': final_output[len(agent_output):]})
+        yield sse_event('done', reply)
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+async def clear_chat(request):
+    sid, state = await current_session(request)
+
+    def clear():
+        clear_history(state)
+        conversation_log.record_clear(sid)
+        summarizer.clear(sid)
+        session_store.save(sid, state)
+    await run_blocking(clear)
+    return JSONResponse({'success': True})
+
+async def full_history(request):
+    sid, state = await current_session(request)
+    try:
+        page = history_page(request.query_params)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    entries, next_cursor = await run_blocking(conversation_log.read, sid, **page)
+    return JSONResponse({'entries': entries, 'next_cursor': next_cursor})
+
+async def parent_alerts(request):
+    sid, state = await current_session(request)
+    try:
+        filters = parent_alert_filters(request.query_params)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    alerts, next_cursor = await run_blocking(parental_log.query, sid, **filters)
+    return JSONResponse({'alerts': alerts, 'next_cursor': next_cursor})
+
+async def involve_parent(request):
+    sid, state = await current_session(request)
+
+    def save():
+        add_to_history(sid, state, '', 'escalation', 'Please ask a parent to assist you.')
+        session_store.save(sid, state)
+    await run_blocking(save)
+    return JSONResponse({'messages': [{'sender': 'Cheeko', 'text': 'Please ask a parent to assist you.', 'timestamp': datetime.now().strftime('%H:%M')}]})
+
+async def continue_chat(request):
+    return JSONResponse({'success': True})
+
+async def metrics(request):
+    return PlainTextResponse(render_metrics(), media_type='text/plain; version=0.0.4')
+
+# Same tracing as app.py's before/after_request hooks. The trace is ended only after
+# the last body chunk, so streamed replies are timed to the last token.
+class TraceMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route = scope["path"] if scope["path"] in ROUTE_PATHS else "unmatched"
+        headers = dict(scope["headers"])
+        trace = start_trace(route, headers.get(TRACE_HEADER.lower().encode(), b"").decode() or None)
+        status = 500
+
+        async def send_with_trace(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(TRACE_HEADER.lower().encode(), trace.trace_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            end_trace(trace, status)
+
+routes = [
+    Route('/', index),
+    Route('/setup', setup, methods=['POST']),
+    Route('/chat', chat, methods=['GET']),
+    Route('/send_message', send_message, methods=['POST']),
+    Route('/send_message_stream', send_message_stream, methods=['POST']),
+    Route('/clear_chat', clear_chat, methods=['POST']),
+    Route('/history', full_history, methods=['GET']),
+    Route('/parent/alerts', parent_alerts, methods=['GET']),
+    Route('/involve_parent', involve_parent, methods=['POST']),
+    Route('/continue_chat', continue_chat, methods=['POST']),
+    Route('/metrics', metrics, methods=['GET'])
+]
+ROUTE_PATHS = {route.path for route in routes}
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(LLM_THREADS, thread_name_prefix="cheeko-llm"))
+    yield
+
+app = Starlette(
+    routes=routes,
+    lifespan=lifespan,
+    middleware=[
+        Middleware(TraceMiddleware),
+        Middleware(SessionMiddleware, secret_key=os.environ.get("CHEEKO_SECRET_KEY") or os.urandom(24).hex())
+    ]
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=8080)
@@ -0,0 +1,216 @@
+import argparse
+import atexit
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+# Benchmarks always run offline unless told otherwise
+os.environ.setdefault("CHEEKO_LLM_BACKEND", "fake")
+os.environ.setdefault("CHEEKO_SESSION_BACKEND", "memory")
+# and keep their made-up children out of the real history, alerts and summaries.
+# Registered before app's log writers, so it runs after they have flushed.
+scratch_dir = tempfile.mkdtemp(prefix="cheeko-benchmark-")
+atexit.register(shutil.rmtree, scratch_dir, ignore_errors=True)
+for name in ("CHEEKO_HISTORY_LOG", "CHEEKO_PARENTAL_LOG", "CHEEKO_SUMMARY_DB"):
+    os.environ.setdefault(name, os.path.join(scratch_dir, "cheeko_history.db"))
+
+import app
+
+WORKLOAD = {
+    "greeting": ["hi", "hello cheeko", "hey there", "howdy"],
+    "math_quiz": ["math quiz please", "give me a quiz", "let's do numbers"],
+    "bedtime_story": ["tell me a bedtime story", "I'm sleepy", "story for sleep please"],
+    "emotional_checkin": ["I'm feeling happy today", "I feel sad", "I'm scared of the dark"]
+}
+STAGES = [
+    "safety_check", "overuse_check", "escalation_check", "classify_intent",
+    "create_tasks", "kickoff_tasks", "reward_child", "add_to_history"
+]
+# Metrics where a bigger number is better; everything else is a latency or a size
+HIGHER_IS_BETTER = {"e2e.rps"}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Wraps app's pipeline functions in place so each call's wall time is recorded per stage
+def instrument_stages(stage_times):
+    lock = threading.Lock()
+
+    def timed(name, fn):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with lock:
+                    stage_times.setdefault(name, []).append(time.perf_counter() - start)
+        return wrapper
+
+    for name in STAGES:
+        setattr(app, name, timed(name, getattr(app, name)))
+
+
+results_lock = threading.Lock()
+
+
+def run_child(child_id, messages_per_child, rng, route_times, errors):
+    client = app.app.test_client()
+    schedule = [("/setup", {"name": f"Kid{child_id}", "theme": rng.choice(["dragons", "cars", "space"])})]
+    for _ in range(messages_per_child):
+        intent = rng.choice(list(WORKLOAD))
+        schedule.append(("/send_message", {"message": rng.choice(WORKLOAD[intent])}))
+    schedule.append(("/chat", None))
+    for route, data in schedule:
+        start = time.perf_counter()
+        try:
+            response = client.get(route) if data is None else client.post(route, data=data)
+            ok = response.status_code == 200
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with results_lock:
+            route_times.setdefault(route, []).append(elapsed)
+            if not ok:
+                errors[route] = errors.get(route, 0) + 1
+
+
+def run_e2e(children, messages_per_child, concurrency, seed):
+    stage_times, route_times, errors = {}, {}, {}
+    instrument_stages(stage_times)
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for child_id in range(children):
+            pool.submit(run_child, child_id, messages_per_child, random.Random(seed + child_id), route_times, errors)
+    elapsed = time.perf_counter() - start
+    total_requests = sum(len(times) for times in route_times.values())
+    all_times = [t for times in route_times.values() for t in times]
+    results = {
+        "e2e.requests": total_requests,
+        "e2e.rps": total_requests / elapsed,
+        "e2e.p50_ms": percentile(all_times, 50) * 1000,
+        "e2e.p99_ms": percentile(all_times, 99) * 1000,
+        "e2e.memory_growth_mb": rss_mb() - rss_before,
+        "e2e.errors": sum(errors.values())
+    }
+    for route, times in route_times.items():
+        results[f"route{route}.p50_ms"] = percentile(times, 50) * 1000
+        results[f"route{route}.p99_ms"] = percentile(times, 99) * 1000
+    for stage, times in stage_times.items():
+        results[f"stage.{stage}.p50_ms"] = percentile(times, 50) * 1000
+        results[f"stage.{stage}.p99_ms"] = percentile(times, 99) * 1000
+    return results
+
+
+def fill_history(state, size, rng):
+    app.MAX_HISTORY = size
+    for i in range(size):
+        intent = rng.choice(list(WORKLOAD))
+        app.add_to_history(f"bench-micro-{size}", state, f"{rng.choice(WORKLOAD[intent])} {i}", intent, f"Cheeko reply number {i}")
+
+
+def run_micro(sizes, number, seed):
+    results = {}
+    max_history = app.MAX_HISTORY
+    for size in sizes:
+        rng = random.Random(seed)
+        state = app.session_store.get(f"bench-micro-{size}")
+        state["user_profile"].update({"name": "Kid", "favorite_theme": "dragons"})
+        fill_history(state, size, rng)
+        query = "tell me a bedtime story about dragons"
+        calls = {
+            "detect_intent": lambda: app.detect_intent(state, query),
+            "get_relevant_history": lambda: app.get_relevant_history(state, query),
+            "safety_check": lambda: app.safety_check(state, query),
+            "escalation_check": lambda: app.escalation_check(f"bench-micro-{size}", state, query)
+        }
+        for name, call in calls.items():
+            seconds = min(timeit.repeat(call, number=number, repeat=3)) / number
+            results[f"micro.{name}.h{size}_us"] = seconds * 1e6
+        app.session_store.delete(f"bench-micro-{size}")
+    app.MAX_HISTORY = max_history
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, value in results.items():
+        if name not in baseline or name in ("e2e.requests", "e2e.errors") or not baseline[name]:
+            continue
+        change = (value - baseline[name]) / baseline[name]
+        if name in HIGHER_IS_BETTER:
+            change = -change
+        if change > tolerance:
+            regressions.append((name, baseline[name], value, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Cheeko /send_message pipeline against the offline LLM")
+    parser.add_argument("--children", type=int, default=10, help="simulated children, each with its own session")
+    parser.add_argument("--messages", type=int, default=6, help="messages each child sends")
+    parser.add_argument("--concurrency", type=int, default=1, help="children chatting at the same time")
+    parser.add_argument("--micro-sizes", default="20,100,500,2000", help="history sizes for the microbenchmarks")
+    parser.add_argument("--micro-number", type=int, default=200, help="calls per microbenchmark repeat")
+    parser.add_argument("--skip-e2e", action="store_true")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--baseline", default="benchmark_baseline.json", help="results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before a metric counts as a regression")
+    parser.add_argument("--output", help="also write this run's results as JSON")
+    args = parser.parse_args(argv)
+
+    results = {}
+    if not args.skip_micro:
+        results.update(run_micro([int(size) for size in args.micro_sizes.split(",")], args.micro_number, args.seed))
+    if not args.skip_e2e:
+        results.update(run_e2e(args.children, args.messages, args.concurrency, args.seed))
+
+    width = max(len(name) for name in results)
+    for name, value in sorted(results.items()):
+        print(f"{name:<{width}}  {value:12.3f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nSaved baseline to {args.baseline}")
+        return 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for name, before, after, change in regressions:
+                print(f"  {name}: {before:.3f} -> {after:.3f} ({change:+.0%})")
+            return 1
+        print(f"\nNo regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,11 @@
+from uvicorn_worker import UvicornWorker
+
+
+# UvicornWorker passes uvicorn only keepalive, backlog, forwarded_allow_ips and the SSL
+# options, so gunicorn's worker_connections would otherwise be ignored. Here it becomes
+# uvicorn's limit_concurrency: past that many open connections and tasks, the worker
+# answers 503 at once instead of queueing more conversations.
+class CheekoUvicornWorker(UvicornWorker):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config.limit_concurrency = self.cfg.worker_connections
@@ -0,0 +1,59 @@
+import os
+
+# Rough size of a token for English text; close enough to budget prompts without a tokenizer
+CHARS_PER_TOKEN = 4
+DEFAULT_CONTEXT_TOKENS = int(os.environ.get("CHEEKO_CONTEXT_TOKENS", "200"))
+# Below this an entry's output says nothing useful, so it is left out instead
+MIN_OUTPUT_CHARS = 24
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def clip(text, limit):
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    return text[:max(limit - 1, 0)].rstrip() + "…"
+
+
+# The relevant history for one request, rendered one line per entry (most relevant
+# first) with outputs clipped to fit a token budget. A rolling summary of older chats,
+# if there is one, goes first and takes at most a third of the budget. Each budget is
+# rendered once and reused by every task that asks for it.
+class HistoryContext:
+    def __init__(self, entries, summary=""):
+        self.entries = entries
+        self.summary = summary
+        self._rendered = {}
+
+    def render(self, budget=DEFAULT_CONTEXT_TOKENS):
+        if budget not in self._rendered:
+            self._rendered[budget] = self._render(budget)
+        return self._rendered[budget]
+
+    def _render(self, budget):
+        remaining = budget * CHARS_PER_TOKEN
+        earlier = ""
+        if self.summary:
+            earlier = "Earlier: " + clip(self.summary, remaining // 3 - len("Earlier: "))
+            remaining -= len(earlier) + 1
+        lines = []
+        for position, entry in enumerate(self.entries):
+            # Split what's left evenly, so space an entry doesn't use passes to the next
+            share = remaining // (len(self.entries) - position)
+            head = f'- {entry["intent"]}: "{clip(entry["input"], share // 3)}" -> "'
+            room = share - len(head) - 1
+            if room < MIN_OUTPUT_CHARS:
+                continue
+            line = head + clip(entry["output"], room) + '"'
+            remaining -= len(line) + 1
+            lines.append(line)
+        if lines:
+            lines.insert(0, "Previous chats:")
+        if earlier:
+            lines.insert(0, earlier)
+        if not lines:
+            return "No relevant history."
+        return "\n".join(lines)
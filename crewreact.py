@@ -1,14 +1,8 @@
-from crewai import Agent, Task, Crew, LLM
+from crewai import Agent, Task, Crew
+from llm_backend import create_llm
 
 # Initialize Large Language Model (LLM)
-llm = LLM(
-    model="groq/llama-3.3-70b-versatile",
-    temperature=0.5,
-    max_completion_tokens=1024,
-    top_p=0.9,
-    stop=None,
-    stream=False,
-)
+llm = create_llm()
 
 # Create CrewAI agents
 summarizer = Agent(
@@ -0,0 +1,225 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("cheeko.durable_log")
+
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Every commit is fsynced; the writer commits once per batch, not once per row
+    conn.execute("PRAGMA synchronous=FULL")
+    return conn
+
+
+# One SQLite connection per thread and process, opened on first use. SQLite
+# connections must not cross a fork, so a gunicorn worker never touches one its master
+# opened: it opens its own, and the inherited one is left alone rather than closed.
+# `schema` statements run once per process, on the first connection.
+class LocalConnections:
+    def __init__(self, path, schema=(), open_connection=connect):
+        self.path = path
+        self.schema = schema
+        self.open_connection = open_connection
+        self._local = threading.local()
+        self._ready_pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        pid = os.getpid()
+        by_pid = self._local.__dict__.setdefault("by_pid", {})
+        conn = by_pid.get(pid)
+        if conn is None:
+            conn = by_pid[pid] = self.open_connection(self.path)
+        if self._ready_pid != pid:
+            with self._lock:
+                if self._ready_pid != pid:
+                    with conn:
+                        for statement in self.schema:
+                            conn.execute(statement)
+                    self._ready_pid = pid
+        return conn
+
+
+# Requests only enqueue rows; one writer thread per process drains the queue and
+# commits whatever arrived within flush_interval as a single transaction. The writer
+# starts on first use, so a gunicorn master that imports the app before forking
+# doesn't leave workers holding a dead thread. `open_connection` is called on the
+# writer thread, so a LocalConnections.get there creates the schema before the
+# first batch lands in a fresh database.
+class BatchWriter:
+    def __init__(self, path, insert_sql, flush_interval=0.5, batch_size=256, max_pending=10000,
+                 open_connection=None):
+        self.path = path
+        self.insert_sql = insert_sql
+        self.open_connection = open_connection or (lambda: connect(path))
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue(max_pending)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def put(self, row):
+        self._ensure_writer()
+        # Blocks when the disk falls behind rather than dropping rows
+        self._queue.put(row)
+
+    def flush(self):
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _ensure_writer(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(self._queue.maxsize)
+                self._thread = threading.Thread(target=self._run, name="cheeko-log-writer", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        conn = self.open_connection()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            rows = [row for row in batch if row is not None]
+            try:
+                with conn:
+                    conn.executemany(self.insert_sql, rows)
+            except sqlite3.Error:
+                logger.exception("Dropped %d rows that could not be written to %s", len(rows), self.path)
+            for _ in batch:
+                self._queue.task_done()
+            if batch[-1] is None:
+                conn.close()
+                return
+
+
+# A table that is only ever appended to through a BatchWriter and read page by page
+class SQLiteLog:
+    schema = ()
+    insert_sql = ""
+
+    def __init__(self, path, flush_interval=0.5, max_pending=10000):
+        self.path = path
+        self._connections = LocalConnections(path, self.schema)
+        self.writer = BatchWriter(path, self.insert_sql, flush_interval, max_pending=max_pending,
+                                  open_connection=self._connect)
+
+    def _connect(self):
+        return self._connections.get()
+
+    # Newest first, by row id; the cursor is passed back as `before` for the next page
+    def _page(self, sql, params, before, limit):
+        rows = self._connect().execute(
+            sql + " AND id < ? ORDER BY id DESC LIMIT ?",
+            list(params) + [before if before is not None else 2 ** 63 - 1, limit]
+        ).fetchall()
+        return rows, (rows[-1][0] if rows and len(rows) == limit else None)
+
+
+# Append-only record of every history entry, kept after the entry leaves the
+# in-memory window and after /clear_chat, which only writes a "clear" marker
+class ConversationLog(SQLiteLog):
+    schema = (
+        "CREATE TABLE IF NOT EXISTS conversation_log ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, kind TEXT NOT NULL, "
+        "seq INTEGER, timestamp REAL NOT NULL, input TEXT, intent TEXT, output TEXT, flags TEXT)",
+        "CREATE INDEX IF NOT EXISTS conversation_log_session ON conversation_log (session_id, id)"
+    )
+    insert_sql = (
+        "INSERT INTO conversation_log (session_id, kind, seq, timestamp, input, intent, output, flags) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+    )
+
+    def append(self, session_id, entry):
+        self.writer.put((
+            session_id, "message", entry["seq"], entry["timestamp"], entry["input"],
+            entry["intent"], entry["output"], json.dumps(entry.get("flags", {}))
+        ))
+
+    def record_clear(self, session_id):
+        self.writer.put((session_id, "clear", None, time.time(), None, None, None, None))
+
+    def read(self, session_id, before=None, limit=50):
+        rows, cursor = self._page(
+            "SELECT id, kind, seq, timestamp, input, intent, output, flags FROM conversation_log WHERE session_id = ?",
+            [session_id], before, limit
+        )
+        entries = [
+            {"id": row[0], "kind": row[1], "seq": row[2], "timestamp": row[3], "input": row[4],
+             "intent": row[5], "output": row[6], "flags": json.loads(row[7]) if row[7] else {}}
+            for row in rows
+        ]
+        return entries, cursor
+
+
+PARENTAL_EVENT_TYPES = ("message", "overuse", "escalation")
+
+
+# Alerts for parents: every logged message plus overuse and escalation events.
+# Only the unflushed tail is ever held in memory, capped at max_pending.
+class ParentalLog(SQLiteLog):
+    schema = (
+        "CREATE TABLE IF NOT EXISTS parental_log ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, event_type TEXT NOT NULL, "
+        "timestamp REAL NOT NULL, message TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS parental_log_session ON parental_log (session_id, id)",
+        "CREATE INDEX IF NOT EXISTS parental_log_session_type ON parental_log (session_id, event_type, id)"
+    )
+    insert_sql = "INSERT INTO parental_log (session_id, event_type, timestamp, message) VALUES (?, ?, ?, ?)"
+
+    def record(self, session_id, event_type, message):
+        self.writer.put((session_id, event_type, time.time(), message))
+
+    def query(self, session_id, event_types=None, since=None, until=None, before=None, limit=50):
+        sql = "SELECT id, event_type, timestamp, message FROM parental_log WHERE session_id = ?"
+        params = [session_id]
+        if event_types:
+            sql += f" AND event_type IN ({', '.join('?' * len(event_types))})"
+            params.extend(event_types)
+        if since is not None:
+            sql += " AND timestamp >= ?"
+            params.append(since)
+        if until is not None:
+            sql += " AND timestamp < ?"
+            params.append(until)
+        rows, cursor = self._page(sql, params, before, limit)
+        return [{"id": row[0], "event_type": row[1], "timestamp": row[2], "message": row[3]} for row in rows], cursor
+
+
+def create_conversation_log():
+    return ConversationLog(
+        os.environ.get("CHEEKO_HISTORY_LOG", "cheeko_history.db"),
+        float(os.environ.get("CHEEKO_HISTORY_FLUSH_INTERVAL", "0.5"))
+    )
+
+
+def create_parental_log():
+    return ParentalLog(
+        os.environ.get("CHEEKO_PARENTAL_LOG", "cheeko_history.db"),
+        float(os.environ.get("CHEEKO_PARENTAL_FLUSH_INTERVAL", "1.0")),
+        int(os.environ.get("CHEEKO_PARENTAL_MAX_PENDING", "10000"))
+    )
@@ -0,0 +1,45 @@
+# Gunicorn settings for Cheeko.
+#
+# Async (recommended): gunicorn asgi:app -c gunicorn.conf.py
+#   Each worker is a uvicorn event loop; a request awaits crew.akickoff() instead of
+#   holding a request thread. crewai still runs each LLM call on a thread, so a worker
+#   has at most CHEEKO_ASGI_THREADS (default 64) LLM calls in flight; conversations
+#   beyond that wait for a free thread.
+#
+# Sync: CHEEKO_WORKER_CLASS=gthread gunicorn app:app -c gunicorn.conf.py
+#   Concurrency is workers x threads; each request holds a thread for the whole crew run.
+#
+# Workers share children only through CHEEKO_SESSION_BACKEND=sqlite, and read each
+# other's cookies only with a fixed CHEEKO_SECRET_KEY. Without both, every worker has
+# its own sessions and key and requests fail at random, so there is one worker by
+# default and asking for more is refused.
+import multiprocessing
+import os
+import sys
+
+bind = os.environ.get("CHEEKO_BIND", "0.0.0.0:8080")
+worker_class = os.environ.get("CHEEKO_WORKER_CLASS", "cheeko_worker.CheekoUvicornWorker")
+shared_sessions = os.environ.get("CHEEKO_SESSION_BACKEND") == "sqlite" and bool(os.environ.get("CHEEKO_SECRET_KEY"))
+# LLM calls are network-bound, so a couple of workers per core is plenty
+workers = int(os.environ.get("CHEEKO_WORKERS", multiprocessing.cpu_count() * 2 if shared_sessions else 1))
+if workers > 1 and not shared_sessions:
+    sys.exit("CHEEKO_WORKERS > 1 needs CHEEKO_SESSION_BACKEND=sqlite and CHEEKO_SECRET_KEY")
+threads = int(os.environ.get("CHEEKO_THREADS", "8"))
+# Connections (and tasks) an async worker serves at once; beyond that it answers 503.
+# Enforced by cheeko_worker.CheekoUvicornWorker; gthread workers ignore it.
+worker_connections = int(os.environ.get("CHEEKO_WORKER_CONNECTIONS", "1000"))
+# A full strict-mode crew run can take tens of seconds
+timeout = int(os.environ.get("CHEEKO_WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# CHEEKO_PREWARM=1 loads the app, crewai, the LLM client and every agent once in the
+# master before it forks, so new and respawned workers start without paying for them
+# and share those pages copy-on-write
+preload_app = os.environ.get("CHEEKO_PREWARM", "0") == "1"
+
+
+def on_starting(server):
+    if preload_app:
+        import agents
+        agents.prewarm()
@@ -0,0 +1,65 @@
+import heapq
+import re
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return set(TOKEN_PATTERN.findall(text.lower()))
+
+
+# state["chat_history"] is a deque used as a ring buffer over the newest max_history
+# entries: appends and evictions are O(1) and never reallocate the window.
+# Each entry gets a sequence number; state["history_index"] maps a token to the
+# sequence numbers of the entries containing it. Entries are contiguous by
+# sequence number, so an entry is found from its number without scanning.
+# state["flag_counts"] keeps how many entries in the window carry each flag.
+def append_history(state, entry, max_history):
+    history = state["chat_history"]
+    evicted = []
+    while len(history) >= max_history:
+        evicted.append(history.popleft())
+    entry["seq"] = state["history_seq"]
+    entry["tokens"] = sorted(tokenize(entry["input"]) | {entry["intent"].lower()})
+    state["history_seq"] += 1
+    history.append(entry)
+    index = state["history_index"]
+    for token in entry["tokens"]:
+        index.setdefault(token, []).append(entry["seq"])
+    count_flags(state, entry, 1)
+    for old_entry in evicted:
+        count_flags(state, old_entry, -1)
+        for token in old_entry["tokens"]:
+            postings = index[token]
+            postings.remove(old_entry["seq"])
+            if not postings:
+                del index[token]
+    return evicted
+
+
+def count_flags(state, entry, delta):
+    flag_counts = state["flag_counts"]
+    for flag, is_set in entry.get("flags", {}).items():
+        if is_set:
+            flag_counts[flag] = flag_counts.get(flag, 0) + delta
+
+
+def clear_history(state):
+    state["chat_history"].clear()
+    state["history_index"].clear()
+    state["flag_counts"].clear()
+
+
+def search_history(state, user_input, limit=3):
+    history = state["chat_history"]
+    if not history:
+        return []
+    first_seq = history[0]["seq"]
+    overlap = {}
+    for token in tokenize(user_input):
+        for seq in state["history_index"].get(token, ()):
+            overlap[seq] = overlap.get(seq, 0) + 1
+    # Most shared tokens first, newest first among ties
+    ranked = heapq.nlargest(limit, overlap, key=lambda seq: (overlap[seq], seq))
+    return [history[seq - first_seq] for seq in ranked]
+
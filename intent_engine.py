@@ -0,0 +1,54 @@
+import json
+import os
+import re
+
+# Earlier rules win. "pattern" rules are regexes matched at the start of the input,
+# "keywords" rules match when any keyword appears anywhere in it.
+INTENT_RULES = [
+    {"intent": "greeting", "agent": "greetings_agent", "pattern": r"^\s*(hi|hai|hey|hiya|hello|hellow|greet|yo|howdy)\b"},
+    {"intent": "bedtime_story", "agent": "bedtime_story_agent", "keywords": ["bedtime story", "story for sleep", "sotry", "sleepy"]},
+    {"intent": "math_quiz", "agent": "math_quiz_agent", "keywords": ["math", "quiz", "numbers"]},
+    {"intent": "emotional_checkin", "agent": "emotional_checkin_agent", "keywords": ["feeling", "sad", "happy", "scared"]}
+]
+
+
+def load_intent_rules(path=None):
+    path = path or os.environ.get("CHEEKO_INTENT_RULES")
+    if not path:
+        return INTENT_RULES
+    with open(path) as f:
+        return json.load(f)
+
+
+# All keyword rules compile into one alternation, so matching is a single pass over
+# the input however many intents are configured
+class IntentEngine:
+    def __init__(self, rules):
+        self.rules = rules
+        self.agents = {rule["intent"]: rule.get("agent", f"{rule['intent']}_agent") for rule in rules}
+        self.patterns = [
+            (priority, rule["intent"], re.compile(rule["pattern"], re.IGNORECASE))
+            for priority, rule in enumerate(rules) if rule.get("pattern")
+        ]
+        self.keyword_rules = {}
+        for priority, rule in enumerate(rules):
+            for keyword in rule.get("keywords", []):
+                self.keyword_rules.setdefault(keyword.lower(), (priority, rule["intent"]))
+        # At each position the alternation reports only the first keyword that matches
+        # there, so it must be the one that would win: earliest rule, then longest
+        keywords = sorted(self.keyword_rules, key=lambda keyword: (self.keyword_rules[keyword][0], -len(keyword)))
+        # The lookahead also reports keywords that overlap an earlier match
+        self.keyword_regex = re.compile("(?=(" + "|".join(map(re.escape, keywords)) + "))") if keywords else None
+
+    def match(self, user_input):
+        text = user_input.lower().strip()
+        best = (len(self.rules), None)
+        if self.keyword_regex is not None:
+            for keyword in self.keyword_regex.findall(text):
+                best = min(best, self.keyword_rules[keyword])
+        for priority, intent, pattern in self.patterns:
+            if priority >= best[0]:
+                break
+            if pattern.match(text):
+                return intent
+        return best[1]
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+import random
+import time
+
+from crewai import LLM
+from crewai.events.types.llm_events import LLMCallType
+from crewai.llms.base_llm import BaseLLM, llm_call_context
+from pydantic import PrivateAttr
+
+GROQ_MODEL = "groq/llama-3.3-70b-versatile"
+
+# Canned replies per agent role for the offline backend; {n} is a per-call counter
+FAKE_OUTPUTS = {
+    "Content Safety Guardian": ["PASS The message is kid-friendly."],
+    "Screen Time Manager": ["PASS Usage is within healthy limits."],
+    "Parental Support Coordinator": ["PASS No parent needed right now."],
+    "Central Decision Maker": ["Routed to the best Cheeko buddy."],
+    "Welcome Buddy": ["Hi friend! Cheeko is so happy to see you today!"],
+    "Playful Conversationalist": ["Ooh, that sounds super fun! Tell Cheeko more about it!"],
+    "Magical Storyteller": [
+        "Once upon a time, a sleepy little dragon curled up under the stars. "
+        "It counted the twinkling lights one by one, yawned a big cozy yawn, "
+        "and drifted off to the happiest dreams. The end. Goodnight!"
+    ],
+    "Math Adventure Guide": ["Quiz time! What is {n} + 3? Take your time, you've got this!"],
+    "Kind Listener": ["Cheeko is right here with you. Want to tell me how you feel?"],
+    "Memory Keeper": ["Loves sleepy dragon stories and quick math quizzes; says hi to Cheeko every day."]
+}
+FAKE_DEFAULT_OUTPUT = "Cheeko says hello!"
+
+
+# In-process stand-in for Groq with a configurable latency distribution and token
+# rate, so crew.kickoff() paths can be exercised and profiled without network access
+class FakeLLM(BaseLLM):
+    llm_type: str = "fake"
+    provider: str = "fake"
+    # Time to first token: "fixed" (mean), "uniform" (low..high), "normal" (mean, stddev)
+    # or "lognormal" (median, sigma)
+    latency_distribution: str = "lognormal"
+    latency_mean: float = 0.4
+    latency_stddev: float = 0.1
+    latency_low: float = 0.2
+    latency_high: float = 0.8
+    latency_median: float = 0.4
+    latency_sigma: float = 0.35
+    tokens_per_second: float = 250.0
+    outputs: dict = FAKE_OUTPUTS
+    default_output: str = FAKE_DEFAULT_OUTPUT
+    _rng: random.Random = PrivateAttr(default_factory=random.Random)
+    _calls: int = PrivateAttr(default=0)
+
+    def model_post_init(self, __context):
+        super().model_post_init(__context)
+        self._rng.seed(self.seed)
+
+    def supports_function_calling(self):
+        return False
+
+    def sample_latency(self):
+        if self.latency_distribution == "fixed":
+            return self.latency_mean
+        if self.latency_distribution == "uniform":
+            return self._rng.uniform(self.latency_low, self.latency_high)
+        if self.latency_distribution == "normal":
+            return max(0.0, self._rng.gauss(self.latency_mean, self.latency_stddev))
+        if self.latency_distribution == "lognormal":
+            return self._rng.lognormvariate(0, self.latency_sigma) * self.latency_median
+        raise ValueError(f"Unknown latency distribution: {self.latency_distribution}")
+
+    def _reply(self, messages, from_agent):
+        self._calls += 1
+        role = getattr(from_agent, "role", None)
+        text = self._rng.choice(self.outputs.get(role) or [self.default_output]).replace("{n}", str(self._calls))
+        prompt = messages if isinstance(messages, str) else " ".join(str(m.get("content", "")) for m in messages)
+        tokens = [word + " " for word in text.split(" ")]
+        tokens[-1] = tokens[-1].rstrip()
+        usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": len(tokens), "total_tokens": len(prompt.split()) + len(tokens)}
+        return text, tokens, usage
+
+    def _complete(self, messages, text, usage, from_task, from_agent):
+        self._track_token_usage_internal(usage)
+        self._emit_call_completed_event(
+            response=text, call_type=LLMCallType.LLM_CALL, from_task=from_task, from_agent=from_agent,
+            messages=messages, usage=usage, finish_reason="stop"
+        )
+        return text
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, from_task=None, from_agent=None, response_model=None):
+        with llm_call_context():
+            self._emit_call_started_event(messages=messages, from_task=from_task, from_agent=from_agent)
+            text, tokens, usage = self._reply(messages, from_agent)
+            time.sleep(self.sample_latency())
+            if self.stream:
+                for token in tokens:
+                    self._emit_stream_chunk_event(token, from_task=from_task, from_agent=from_agent)
+                    time.sleep(1 / self.tokens_per_second)
+            else:
+                time.sleep(len(tokens) / self.tokens_per_second)
+            return self._complete(messages, text, usage, from_task, from_agent)
+
+    async def acall(self, messages, tools=None, callbacks=None, available_functions=None, from_task=None, from_agent=None, response_model=None):
+        with llm_call_context():
+            self._emit_call_started_event(messages=messages, from_task=from_task, from_agent=from_agent)
+            text, tokens, usage = self._reply(messages, from_agent)
+            await asyncio.sleep(self.sample_latency())
+            if self.stream:
+                for token in tokens:
+                    self._emit_stream_chunk_event(token, from_task=from_task, from_agent=from_agent)
+                    await asyncio.sleep(1 / self.tokens_per_second)
+            else:
+                await asyncio.sleep(len(tokens) / self.tokens_per_second)
+            return self._complete(messages, text, usage, from_task, from_agent)
+
+
+def load_fake_llm_config(path=None):
+    path = path or os.environ.get("CHEEKO_FAKE_LLM_CONFIG")
+    if not path:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+# CHEEKO_LLM_BACKEND picks the backend: "groq" (default) or "fake"
+def create_llm(backend=None, stream=False):
+    backend = backend or os.environ.get("CHEEKO_LLM_BACKEND", "groq")
+    if backend == "groq":
+        return LLM(
+            model=os.environ.get("CHEEKO_LLM_MODEL", GROQ_MODEL),
+            temperature=0.5,
+            max_completion_tokens=1024,
+            top_p=0.9,
+            stop=None,
+            stream=stream,
+        )
+    if backend == "fake":
+        return FakeLLM(model="fake/cheeko", temperature=0.5, stream=stream, **load_fake_llm_config())
+    raise ValueError(f"Unknown LLM backend: {backend}")
@@ -0,0 +1,232 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from functools import wraps
+
+# Seconds; covers regex guards (sub-millisecond) up to slow multi-agent crews
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TRACE_HEADER = "X-Trace-Id"
+
+logger = logging.getLogger("cheeko.trace")
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{format_labels(self.labels, label_values, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, label_values)} {total}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, label_values)} {count}")
+        return lines
+
+
+request_seconds = Histogram("cheeko_request_seconds", "Time to serve a request, including any streamed body.", ("route", "intent", "status"))
+stage_seconds = Histogram("cheeko_stage_seconds", "Time spent in each message pipeline stage.", ("stage", "intent"))
+task_seconds = Histogram("cheeko_task_seconds", "Time for each crewai Task, by the agent running it.", ("agent", "intent"))
+task_failures = Counter("cheeko_task_failures_total", "crewai Tasks that raised.", ("agent", "intent"))
+llm_call_seconds = Histogram("cheeko_llm_call_seconds", "Time for each LLM call, by the agent making it.", ("agent",))
+llm_calls = Counter("cheeko_llm_calls_total", "LLM calls by agent and outcome.", ("agent", "outcome"))
+llm_tokens = Counter("cheeko_llm_tokens_total", "LLM tokens used, by agent and kind.", ("agent", "kind"))
+METRICS = [request_seconds, stage_seconds, task_seconds, task_failures, llm_call_seconds, llm_calls, llm_tokens]
+
+# Extra sources polled at scrape time; each returns a list of exposition lines
+collectors = []
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for collector in collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+
+# Per-request trace. Stage timings are buffered here and only observed once the
+# request ends, so stages that run before the intent is known still get its label.
+class Trace:
+    def __init__(self, route, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.route = route
+        self.intent = "none"
+        self.start = time.perf_counter()
+        self.stages = []
+
+
+current_trace = contextvars.ContextVar("cheeko_trace", default=None)
+
+
+def start_trace(route, trace_id=None):
+    trace = Trace(route, trace_id)
+    current_trace.set(trace)
+    return trace
+
+
+def set_intent(intent):
+    trace = current_trace.get()
+    if trace is not None and intent is not None:
+        trace.intent = intent
+
+
+def current_intent():
+    trace = current_trace.get()
+    return trace.intent if trace is not None else "none"
+
+
+def end_trace(trace, status):
+    elapsed = time.perf_counter() - trace.start
+    request_seconds.observe(elapsed, trace.route, trace.intent, str(status))
+    for stage, seconds in trace.stages:
+        stage_seconds.observe(seconds, stage, trace.intent)
+    if logger.isEnabledFor(logging.INFO):
+        timings = " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in trace.stages)
+        logger.info("trace=%s route=%s intent=%s status=%s total=%.1fms %s",
+                    trace.trace_id, trace.route, trace.intent, status, elapsed * 1000, timings)
+
+
+def timed_stage(name):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                trace = current_trace.get()
+                if trace is None:
+                    stage_seconds.observe(elapsed, name, "none")
+                else:
+                    trace.stages.append((name, elapsed))
+        return wrapper
+    return decorator
+
+
+# crewai reports tasks and LLM calls on its event bus. Handlers run on the bus's own
+# thread pool with a copy of the emitting context, so the current trace is still visible;
+# durations come from the events' own timestamps rather than when the handler runs.
+_started = {}
+_started_lock = threading.Lock()
+_watching = False
+
+
+def _mark_started(key, event):
+    with _started_lock:
+        _started[key] = event.timestamp
+
+
+def _elapsed_since_start(key, event):
+    with _started_lock:
+        started = _started.pop(key, None)
+    return None if started is None else (event.timestamp - started).total_seconds()
+
+
+def _task_agent(event):
+    agent = getattr(event.task, "agent", None)
+    return getattr(agent, "role", None) or event.agent_role or "unknown"
+
+
+def _on_task_started(source, event):
+    _mark_started(("task", event.task_id), event)
+
+
+def _on_task_completed(source, event):
+    elapsed = _elapsed_since_start(("task", event.task_id), event)
+    if elapsed is not None:
+        task_seconds.observe(elapsed, _task_agent(event), current_intent())
+
+
+def _on_task_failed(source, event):
+    _elapsed_since_start(("task", event.task_id), event)
+    task_failures.inc(_task_agent(event), current_intent())
+
+
+def _on_llm_started(source, event):
+    _mark_started(("llm", event.call_id), event)
+
+
+def _on_llm_completed(source, event):
+    agent = event.agent_role or "unknown"
+    elapsed = _elapsed_since_start(("llm", event.call_id), event)
+    if elapsed is not None:
+        llm_call_seconds.observe(elapsed, agent)
+    llm_calls.inc(agent, "ok")
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if (event.usage or {}).get(kind):
+            llm_tokens.inc(agent, kind.replace("_tokens", ""), amount=event.usage[kind])
+
+
+def _on_llm_failed(source, event):
+    _elapsed_since_start(("llm", event.call_id), event)
+    llm_calls.inc(event.agent_role or "unknown", "error")
+
+
+# Deferred until crewai is first needed, so importing this module never loads crewai
+def watch_crewai_events():
+    global _watching
+    if _watching:
+        return
+    from crewai.events import crewai_event_bus
+    from crewai.events.types.llm_events import LLMCallCompletedEvent, LLMCallFailedEvent, LLMCallStartedEvent
+    from crewai.events.types.task_events import TaskCompletedEvent, TaskFailedEvent, TaskStartedEvent
+    crewai_event_bus.on(TaskStartedEvent)(_on_task_started)
+    crewai_event_bus.on(TaskCompletedEvent)(_on_task_completed)
+    crewai_event_bus.on(TaskFailedEvent)(_on_task_failed)
+    crewai_event_bus.on(LLMCallStartedEvent)(_on_llm_started)
+    crewai_event_bus.on(LLMCallCompletedEvent)(_on_llm_completed)
+    crewai_event_bus.on(LLMCallFailedEvent)(_on_llm_failed)
+    _watching = True
@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import app
+from admission import Overloaded
+from history import append_history
+from session_store import new_session_state
+
+# Replays logged messages through the specialized-agent pipeline (classify_intent ->
+# create_tasks -> crew kickoff -> reward_child) without touching sessions, history
+# logs or parent alerts. Each input line is one JSON record:
+#   {"id": ..., "input": "...", "intent": "...", "output": "...",
+#    "profile": {"name": ..., "favorite_theme": ..., "age": ...},
+#    "history": [{"input": ..., "intent": ..., "output": ...}, ...], "summary": "..."}
+# Only "input" is required; "id" defaults to the line number. A logged intent or output
+# is compared against the new one. Results are appended to the output file one line
+# per record as they finish, so an interrupted run picks up where it stopped; records
+# that failed are tried again, and their new result is appended after the old one.
+
+
+# Ids can be any JSON value, lists and objects included
+def id_key(record_id):
+    return json.dumps(record_id, sort_keys=True)
+
+
+def read_records(path, done):
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = {}
+            if not isinstance(record, dict):
+                record = {}
+            record.setdefault("id", number)
+            if id_key(record["id"]) not in done:
+                yield record
+
+
+# Ids that already have a successful result in the output file. A line cut off by a
+# crash is dropped so the record is replayed again.
+def load_checkpoint(path):
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        try:
+            result = json.loads(line)
+            if "error" not in result:
+                done.add(id_key(result["id"]))
+        except (ValueError, KeyError, TypeError):
+            continue
+    return done
+
+
+def replay_record(record):
+    start = time.perf_counter()
+    user_input = record.get("input")
+    result = {"id": record["id"], "input": user_input}
+    try:
+        if not isinstance(user_input, str):
+            raise ValueError("record has no input")
+        state = new_session_state()
+        state["user_profile"].update(record.get("profile", {}))
+        for entry in record.get("history", []):
+            entry = app.history_entry(entry["input"], entry["intent"], entry["output"], entry.get("timestamp"))
+            append_history(state, entry, app.MAX_HISTORY)
+        intent = app.classify_intent(user_input)
+        tasks = app.create_tasks(state, user_input, mode="fast", intent=intent, summary=record.get("summary", ""))
+        output = app.reward_child(state, app.kickoff_tasks(tasks, intent), intent)
+        result.update(intent=intent, output=output)
+        if "intent" in record:
+            result["intent_changed"] = intent != record["intent"]
+        if "output" in record:
+            result["output_changed"] = output != record["output"]
+    except Overloaded:
+        result["error"] = "overloaded"
+    except Exception as exc:
+        result["error"] = f"{type(exc).__name__}: {exc}"
+    result["seconds"] = round(time.perf_counter() - start, 4)
+    return result
+
+
+class Report:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.records = 0
+        self.errors = 0
+        self.intent_changed = 0
+        self.output_changed = 0
+        self.latencies = []
+
+    def add(self, result):
+        self.records += 1
+        self.errors += "error" in result
+        self.intent_changed += bool(result.get("intent_changed"))
+        self.output_changed += bool(result.get("output_changed"))
+        self.latencies.append(result["seconds"])
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        latencies = sorted(self.latencies) or [0.0]
+        return {
+            "records": self.records,
+            "errors": self.errors,
+            "intent_changed": self.intent_changed,
+            "output_changed": self.output_changed,
+            "elapsed_s": elapsed,
+            "records_per_s": self.records / elapsed if elapsed else 0.0,
+            "p50_ms": latencies[len(latencies) // 2] * 1000,
+            "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        }
+
+
+# Keeps at most max_in_flight records submitted, so input is read only as fast as
+# the pool drains it and memory stays flat however long the file is
+def replay(records, pool, out, max_in_flight, report, progress_every=0):
+    pending = set()
+    last_progress = time.perf_counter()
+
+    def drain(return_when):
+        nonlocal pending, last_progress
+        finished, pending = wait(pending, return_when=return_when)
+        for future in finished:
+            result = future.result()
+            out.write(json.dumps(result) + "\n")
+            report.add(result)
+        out.flush()
+        if progress_every and time.perf_counter() - last_progress >= progress_every:
+            last_progress = time.perf_counter()
+            summary = report.summary()
+            print(f"{summary['records']} records, {summary['errors']} errors, {summary['records_per_s']:.1f}/s", file=sys.stderr)
+
+    for record in records:
+        if len(pending) >= max_in_flight:
+            drain(FIRST_COMPLETED)
+        pending.add(pool.submit(replay_record, record))
+    if pending:
+        drain(ALL_COMPLETED)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay logged Cheeko messages through the agent pipeline")
+    parser.add_argument("input", help="JSONL file of records to replay")
+    parser.add_argument("output", help="JSONL file results are appended to; also the resume checkpoint")
+    parser.add_argument("--workers", type=int, default=4, help="records replayed at the same time")
+    parser.add_argument("--processes", action="store_true",
+                        help="replay in worker processes instead of threads; each has its own CHEEKO_LLM_RPM/TPM budget")
+    parser.add_argument("--restart", action="store_true", help="ignore results already in the output file")
+    parser.add_argument("--progress", type=float, default=5.0, help="seconds between progress lines on stderr, 0 for none")
+    args = parser.parse_args(argv)
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    done = load_checkpoint(args.output)
+    if done:
+        print(f"Resuming: {len(done)} records already in {args.output}", file=sys.stderr)
+
+    report = Report()
+    executor = ProcessPoolExecutor if args.processes else ThreadPoolExecutor
+    with executor(max_workers=args.workers) as pool, open(args.output, "a") as out:
+        replay(read_records(args.input, done), pool, out, args.workers * 2, report, args.progress)
+
+    results = report.summary()
+    width = max(len(name) for name in results)
+    for name, value in results.items():
+        print(f"{name:<{width}}  {value:12.3f}")
+    return 1 if results["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import itertools
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# Words kids wrap around an ask without changing it
+FILLER_WORDS = {
+    "a", "an", "the", "me", "i", "you", "u", "can", "could", "will", "would", "please", "pls", "plz",
+    "tell", "give", "want", "wanna", "let", "lets", "s", "do", "some", "one", "now", "hey", "cheeko"
+}
+
+# Words that ask for a different reply than last time, so the cache must not answer
+FRESH_WORDS = {"again", "another", "more", "new", "next", "different", "else"}
+
+
+def normalize_input(user_input):
+    return " ".join(re.sub(r"[^\w\s]", " ", user_input.lower()).split())
+
+
+def wants_fresh(user_input):
+    return not FRESH_WORDS.isdisjoint(normalize_input(user_input).split())
+
+
+# Features of a normalized input: its words, word pairs and the character trigrams of
+# each word, with filler left out, so "dragon story pls" lands on "tell me a dragon
+# story" and small misspellings cost little
+def features(text):
+    words = normalize_input(text).split()
+    words = [word for word in words if word not in FILLER_WORDS] or words
+    feats = [(word, 1.0) for word in words]
+    feats += [(f"{a} {b}", 0.5) for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"<{word}>"
+        feats += [(padded[i:i + 3], 0.3) for i in range(len(padded) - 2)]
+    return feats
+
+
+# Hashing-trick embeddings: no vocabulary or model to load, one unit-length row per text
+def embed(texts, dim):
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for feature, weight in features(text):
+            h = zlib.crc32(feature.encode())
+            vectors[row, h % dim] += weight if h & 0x80000000 else -weight
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-9)
+
+
+# Replies cached by meaning rather than exact wording. Entries live in one fixed-size
+# matrix; a lookup compares the query against every live row of its scope (intent
+# and child profile) in one matrix product and returns the closest reply at or above
+# threshold cosine similarity. Past max_entries the least recently used slot is reused.
+class SemanticCache:
+    def __init__(self, max_entries=1024, threshold=0.8, dim=1024):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.dim = dim
+        self.hits = {}
+        self.misses = {}
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._slots = [None] * max_entries  # (scope, value, expires)
+        self._used = np.zeros(max_entries, dtype=np.int64)
+        self._scopes = {}
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._clock = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _release(self, slot):
+        scope = self._slots[slot][0]
+        self._slots[slot] = None
+        self._used[slot] = 0
+        self._scopes[scope].discard(slot)
+        if not self._scopes[scope]:
+            del self._scopes[scope]
+        self._free.append(slot)
+
+    def _live(self, scope):
+        now = time.time()
+        slots = self._scopes.get(scope, ())
+        for slot in [slot for slot in slots if self._slots[slot][2] < now]:
+            self._release(slot)
+        return list(self._scopes.get(scope, ()))
+
+    def _count(self, counts, scope):
+        intent = scope[0]
+        counts[intent] = counts.get(intent, 0) + 1
+
+    # Scope is a tuple starting with the intent; it must match exactly
+    def get(self, scope, text):
+        return self.get_many(scope, [text])[0]
+
+    def get_many(self, scope, texts):
+        queries = embed(texts, self.dim)
+        with self._lock:
+            slots = self._live(scope)
+            if not slots:
+                for _ in texts:
+                    self._count(self.misses, scope)
+                return [None] * len(texts)
+            similarity = queries @ self._vectors[slots].T
+            best = similarity.argmax(axis=1)
+            results = []
+            for row, column in enumerate(best):
+                if similarity[row, column] < self.threshold:
+                    self._count(self.misses, scope)
+                    results.append(None)
+                    continue
+                slot = slots[column]
+                self._used[slot] = next(self._clock)
+                self._count(self.hits, scope)
+                results.append(self._slots[slot][1])
+            return results
+
+    def put(self, scope, text, value, ttl):
+        vector = embed([text], self.dim)[0]
+        with self._lock:
+            if not self._free:
+                self._release(int(self._used.argmin()))
+            slot = self._free.pop()
+            self._vectors[slot] = vector
+            self._slots[slot] = (scope, value, time.time() + ttl)
+            self._used[slot] = next(self._clock)
+            self._scopes.setdefault(scope, set()).add(slot)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": self.max_entries - len(self._free),
+                "intents": {
+                    intent: {"hits": self.hits.get(intent, 0), "misses": self.misses.get(intent, 0)}
+                    for intent in set(self.hits) | set(self.misses)
+                }
+            }
@@ -1,19 +1,17 @@
 import tkinter as tk
 from tkinter import ttk
+import tkinter.font as tkfont
+import bisect
 import json
+import queue
+import threading
 import time
-from crewai import Agent, Task, Crew, LLM
+from crewai import Agent, Task, Crew
+from llm_backend import create_llm
 import re
 
-# Initialize LLM
-llm = LLM(
-    model="groq/llama-3.3-70b-versatile",
-    temperature=0.5,
-    max_completion_tokens=1024,
-    top_p=0.9,
-    stop=None,
-    stream=False,
-)
+# Initialize LLM; streaming lets replies appear in the bubble as they are written
+llm = create_llm(stream=True)
 
 # Session and user tracking
 session_start_time = time.time()
@@ -252,14 +250,175 @@ def create_tasks(user_input):
     return [safety_task, overuse_task, escalation_task, route_task, specialized_task]
 
 # Create Crew
-crew = Crew(
-    agents=[
-        root_kids_agent, inappropriate_filter_agent, overuse_monitor_agent, help_escalation_agent,
-        greetings_agent, chit_chat_agent, bedtime_story_agent, math_quiz_agent, emotional_checkin_agent
-    ],
-    tasks=[],
-    verbose=True
-)
+crew_agents = [
+    root_kids_agent, inappropriate_filter_agent, overuse_monitor_agent, help_escalation_agent,
+    greetings_agent, chit_chat_agent, bedtime_story_agent, math_quiz_agent, emotional_checkin_agent
+]
+
+def create_crew(tasks):
+    return Crew(agents=crew_agents, tasks=tasks, verbose=True, stream=True)
+
+# Runs crews one at a time on a background thread so the Tk main loop never blocks.
+# Results go on `replies` as (request_id, kind, payload) for the UI to pick up with
+# after(): "chunk" carries streamed text of the reply, then "done" the final output
+# or "error" a message. A cancelled request sends only "cancelled", once its crew has
+# run to the end: the next one can't start before that, since they share the agents.
+class ReplyWorker:
+    def __init__(self):
+        self.replies = queue.Queue()
+        self._jobs = queue.Queue()
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="cheeko-replies", daemon=True).start()
+
+    def submit(self, request_id, tasks):
+        self._jobs.put((request_id, tasks))
+
+    def cancel(self, request_id):
+        with self._lock:
+            self._cancelled.add(request_id)
+
+    def _is_cancelled(self, request_id):
+        with self._lock:
+            return request_id in self._cancelled
+
+    def _run(self):
+        while True:
+            request_id, tasks = self._jobs.get()
+            try:
+                if self._is_cancelled(request_id):
+                    continue
+                streaming = create_crew(tasks).kickoff()
+                # Chunks don't say which task they belong to, but the reply's agent runs only the last one
+                reply_role = tasks[-1].agent.role
+                for chunk in streaming:
+                    if chunk.agent_role == reply_role and chunk.content and not self._is_cancelled(request_id):
+                        self.replies.put((request_id, "chunk", chunk.content))
+                if not self._is_cancelled(request_id):
+                    self.replies.put((request_id, "done", streaming.result))
+            except Exception as exc:
+                if not self._is_cancelled(request_id):
+                    self.replies.put((request_id, "error", str(exc)))
+            finally:
+                with self._lock:
+                    if request_id in self._cancelled:
+                        self._cancelled.discard(request_id)
+                        self.replies.put((request_id, "cancelled", None))
+
+# The chat transcript, drawn on a canvas with widgets only for the messages on
+# screen. Each message's height is worked out from the font once, when it is added,
+# and kept as a running offset: appending is O(1), finding the visible messages is a
+# bisect, and the handful of bubble Labels are reused as the view scrolls.
+class MessageList:
+    WRAP_LENGTH = 400
+    PAD_X = 10
+    PAD_Y = 5
+    # Space between bubbles
+    GAP = 10
+
+    def __init__(self, canvas, scrollbar):
+        self.canvas = canvas
+        self.scrollbar = scrollbar
+        self.font = tkfont.Font(family="Arial", size=12)
+        self.line_height = self.font.metrics("linespace")
+        self.messages = []  # (text, is_user)
+        self.offsets = [0]  # top of each message, then the bottom of the last one
+        self.bubbles = []  # [canvas window, label, (index, text) it shows]
+        self.canvas.configure(yscrollcommand=self._on_scroll, yscrollincrement=20)
+        self.canvas.bind("<Configure>", lambda e: self._resize())
+
+    def _lines(self, text):
+        space = self.font.measure(" ")
+        lines = 0
+        for paragraph in text.split("\n"):
+            lines += 1
+            width = 0  # of the line being filled
+            for word in paragraph.split(" "):
+                word_width = self.font.measure(word)
+                if width and width + space + word_width > self.WRAP_LENGTH:
+                    lines += 1
+                    width = 0
+                if width:
+                    width += space + word_width
+                elif word_width > self.WRAP_LENGTH:
+                    # The Label breaks a word wider than a line, such as a URL, across
+                    # ceil(width / WRAP_LENGTH) lines; the next word follows its tail
+                    extra = -(-word_width // self.WRAP_LENGTH) - 1
+                    lines += extra
+                    width = word_width - extra * self.WRAP_LENGTH
+                else:
+                    width = word_width
+        return lines
+
+    def _height(self, text):
+        return self._lines(text) * self.line_height + 2 * self.PAD_Y + self.GAP
+
+    def _at_bottom(self):
+        return self.canvas.yview()[1] >= 0.999
+
+    def _resize(self):
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), self.offsets[-1]))
+        self.render()
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.render()
+
+    # Returns the new message's index, for update()
+    def append(self, text, is_user=False):
+        self.messages.append((text, is_user))
+        self.offsets.append(self.offsets[-1] + self._height(text))
+        self._resize()
+        self.canvas.yview_moveto(1)
+        return len(self.messages) - 1
+
+    def update(self, index, text):
+        follow = self._at_bottom()
+        is_user = self.messages[index][1]
+        self.messages[index] = (text, is_user)
+        change = self._height(text) - (self.offsets[index + 1] - self.offsets[index])
+        # Only messages below move; for the latest message that's none
+        for position in range(index + 1, len(self.offsets)):
+            self.offsets[position] += change
+        self._resize()
+        if follow:
+            self.canvas.yview_moveto(1)
+
+    def clear(self):
+        self.messages = []
+        self.offsets = [0]
+        self._resize()
+        self.canvas.yview_moveto(0)
+
+    def render(self):
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        width = self.canvas.winfo_width()
+        slot = 0
+        index = max(bisect.bisect_right(self.offsets, top) - 1, 0)
+        while index < len(self.messages) and self.offsets[index] < bottom:
+            self._show(slot, index, width)
+            slot += 1
+            index += 1
+        for window, _, _ in self.bubbles[slot:]:
+            self.canvas.itemconfigure(window, state="hidden")
+
+    def _show(self, slot, index, width):
+        text, is_user = self.messages[index]
+        if slot == len(self.bubbles):
+            label = tk.Label(self.canvas, font=self.font, wraplength=self.WRAP_LENGTH, padx=self.PAD_X, pady=self.PAD_Y, borderwidth=0)
+            self.bubbles.append([self.canvas.create_window(0, 0, window=label), label, None])
+        window, label, shown = self.bubbles[slot]
+        if shown != (index, text):
+            label.config(
+                text=text,
+                bg="#DCF8C6" if is_user else "#FFFFFF",  # Green for user, white for Cheeko
+                justify="right" if is_user else "left"
+            )
+            self.bubbles[slot][2] = (index, text)
+        x, anchor = (width - self.PAD_X, "ne") if is_user else (self.PAD_X, "nw")
+        self.canvas.coords(window, x, self.offsets[index] + self.GAP // 2)
+        self.canvas.itemconfigure(window, anchor=anchor, state="normal")
 
 # Tkinter UI with WhatsApp-style Enhancements
 class CheekoUI:
@@ -268,6 +427,12 @@ class CheekoUI:
         self.root.title("Cheeko Chat Setup")
         self.root.geometry("800x600")
         self.root.configure(bg="#f0f0f0")
+        self.worker = ReplyWorker()
+        self.request_seq = 0
+        # (request_id, user_input, intent, bubble index, text so far) while Cheeko is replying
+        self.pending = None
+        # A stopped request whose crew is still finishing; Send waits for it
+        self.stopping = None
 
         # Onboarding frame
         self.onboarding_frame = tk.Frame(self.root, bg="#f0f0f0")
@@ -321,15 +486,15 @@ class CheekoUI:
 
         self.chat_canvas = tk.Canvas(self.chat_frame, bg="#ECE5DD", highlightthickness=0)
         self.scrollbar = tk.Scrollbar(self.chat_frame, orient="vertical", command=self.chat_canvas.yview)
-        self.chat_canvas.configure(yscrollcommand=self.scrollbar.set)
 
         self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.chat_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        self.message_frame = tk.Frame(self.chat_canvas, bg="#ECE5DD")
-        self.chat_canvas.create_window((0, 0), window=self.message_frame, anchor="nw")
-        self.message_frame.bind("<Configure>", lambda e: self.chat_canvas.configure(scrollregion=self.chat_canvas.bbox("all")))
+        self.messages = MessageList(self.chat_canvas, self.scrollbar)
         self.chat_canvas.bind_all("<MouseWheel>", self._on_mousewheel)
+        # X11 reports the wheel as buttons 4 and 5
+        self.chat_canvas.bind_all("<Button-4>", lambda e: self.chat_canvas.yview_scroll(-3, "units"))
+        self.chat_canvas.bind_all("<Button-5>", lambda e: self.chat_canvas.yview_scroll(3, "units"))
 
         # Input area
         self.input_frame = tk.Frame(self.root, bg="#f0f0f0")
@@ -341,46 +506,27 @@ class CheekoUI:
 
         self.send_button = tk.Button(self.input_frame, text="Send to Cheeko", font=("Arial", 12), bg="#128C7E", fg="white", command=self.send_message)
         self.send_button.pack(side=tk.RIGHT, padx=5)
+        # Shown only while a reply is on its way
+        self.cancel_button = tk.Button(self.input_frame, text="Stop", font=("Arial", 12), command=self.cancel_reply)
+
+        self.root.after(50, self.poll_replies)
 
     def _on_mousewheel(self, event):
-        self.chat_canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
+        self.chat_canvas.yview_scroll(int(-3 * (event.delta / 120)), "units")
 
     def display_message(self, message, is_user=False):
-        bubble_frame = tk.Frame(self.message_frame, bg="#ECE5DD")
-        bubble_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        if is_user:
-            bubble_bg = "#DCF8C6"  # Green for user
-            bubble_frame.pack(anchor="e")
-            bubble_width = 50
-            anchor = "e"
-        else:
-            bubble_bg = "#FFFFFF"  # White for Cheeko
-            bubble_frame.pack(anchor="w")
-            bubble_width = 50
-            anchor = "w"
-
-        message_label = tk.Label(
-            bubble_frame,
-            text=message,
-            font=("Arial", 12),
-            bg=bubble_bg,
-            wraplength=400,
-            justify="left" if not is_user else "right",
-            padx=10,
-            pady=5
-        )
-        message_label.pack(anchor=anchor)
-        self.chat_canvas.update_idletasks()
-        self.chat_canvas.yview_moveto(1)
+        return self.messages.append(message, is_user)
+
+    def update_message(self, index, message):
+        self.messages.update(index, message)
 
     def clear_chat(self):
-        for widget in self.message_frame.winfo_children():
-            widget.destroy()
-        self.chat_canvas.update_idletasks()
-        self.chat_canvas.yview_moveto(1)
+        self.cancel_reply()
+        self.messages.clear()
 
     def send_message(self, event=None):
+        if self.pending is not None or self.stopping is not None:
+            return
         user_input = handle_input(self.input_field.get())
         self.input_field.delete(0, tk.END)
         self.display_message(f"{user_profile['name']}: {user_input}", is_user=True)
@@ -405,32 +551,81 @@ class CheekoUI:
             tk.Button(self.input_frame, text="Yes, parent", command=self.involve_parent).pack(side=tk.RIGHT, padx=5)
             tk.Button(self.input_frame, text="No, continue", command=self.continue_chat).pack(side=tk.RIGHT, padx=5)
             return
-        loading_label = tk.Label(self.message_frame, text="Cheeko is typing...", font=("Arial", 10, "italic"), bg="#ECE5DD", fg="#555555")
-        loading_label.pack(anchor="w", padx=10, pady=5)
-        self.chat_canvas.update_idletasks()
-        self.chat_canvas.yview_moveto(1)
-        self.root.update()
-
-        crew.tasks = create_tasks(user_input)
-        result = crew.kickoff()
+        # Tasks are built here, on the UI thread, so only it reads or changes the chat state
         intent = detect_intent(user_input)[0]
-        final_output = reward_child(result, intent)
+        tasks = create_tasks(user_input)
+        self.request_seq += 1
+        bubble = self.display_message("Cheeko is typing", is_user=False)
+        self.pending = (self.request_seq, user_input, intent, bubble, "")
+        self.send_button.config(state='disabled')
+        self.cancel_button.pack(side=tk.RIGHT, padx=5)
+        self.worker.submit(self.request_seq, tasks)
+        self.animate_typing(self.request_seq, 0)
+
+    # Each request has its own timer chain, so one left over from a stopped request
+    # can't keep animating the next
+    def animate_typing(self, request_id, step):
+        if self.pending is None or self.pending[0] != request_id or self.pending[4]:
+            return
+        self.update_message(self.pending[3], "Cheeko is typing" + "." * (step % 4))
+        self.root.after(400, self.animate_typing, request_id, step + 1)
 
-        loading_label.destroy()
-        self.display_message(f"Cheeko: {final_output}", is_user=False)
-        add_to_history(user_input, intent, final_output)
+    def poll_replies(self):
+        while True:
+            try:
+                request_id, kind, payload = self.worker.replies.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "cancelled":
+                if request_id == self.stopping:
+                    self.stopping = None
+                    self.send_button.config(state='normal')
+                continue
+            # Anything from a cancelled or earlier request is stale
+            if self.pending is None or request_id != self.pending[0]:
+                continue
+            _, user_input, intent, bubble, text = self.pending
+            if kind == "chunk":
+                text += payload
+                self.pending = (request_id, user_input, intent, bubble, text)
+                self.update_message(bubble, f"Cheeko: {text}")
+            elif kind == "done":
+                final_output = reward_child(payload, intent)
+                self.update_message(bubble, f"Cheeko: {final_output}")
+                add_to_history(user_input, intent, final_output)
+                self.finish_reply()
+            else:
+                self.update_message(bubble, "Cheeko: Oops, Cheeko got mixed up! Can you say that again?")
+                self.finish_reply()
+        self.root.after(50, self.poll_replies)
+
+    def cancel_reply(self):
+        if self.pending is None:
+            return
+        request_id, _, _, bubble, text = self.pending
+        self.worker.cancel(request_id)
+        self.update_message(bubble, f"Cheeko: {text} …" if text else "Cheeko: Okay, Cheeko stopped. What’s next?")
+        self.finish_reply()
+        # Send comes back once the worker reports the crew done
+        self.stopping = request_id
+        self.send_button.config(state='disabled')
+
+    def finish_reply(self):
+        self.pending = None
+        self.send_button.config(state='normal')
+        self.cancel_button.pack_forget()
 
     def involve_parent(self):
         self.display_message("Cheeko: Ask a parent to help!", is_user=False)
         self.input_field.config(state='normal')
         for widget in self.input_frame.winfo_children():
-            if isinstance(widget, tk.Button) and widget != self.send_button:
+            if isinstance(widget, tk.Button) and widget not in (self.send_button, self.cancel_button):
                 widget.destroy()
 
     def continue_chat(self):
         self.input_field.config(state='normal')
         for widget in self.input_frame.winfo_children():
-            if isinstance(widget, tk.Button) and widget != self.send_button:
+            if isinstance(widget, tk.Button) and widget not in (self.send_button, self.cancel_button):
                 widget.destroy()
 
 # Run the UI
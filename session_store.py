@@ -0,0 +1,126 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+from durable_log import LocalConnections
+
+MAX_HISTORY = int(os.environ.get("CHEEKO_MAX_HISTORY", "20"))
+
+
+def new_session_state():
+    return {
+        "user_profile": {"name": "", "age": 7, "favorite_theme": ""},
+        "chat_history": deque(),
+        "history_seq": 0,
+        "history_index": {},
+        "flag_counts": {},
+        "points": 0,
+        "interaction_count": 0,
+        "session_start_time": time.time()
+    }
+
+
+# In-process store: one dict lookup per request, least recently used sessions evicted
+class MemorySessionStore:
+    def __init__(self, max_sessions=10000):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                state = new_session_state()
+                self._sessions[session_id] = state
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return state
+
+    def save(self, session_id, state):
+        with self._lock:
+            self._sessions[session_id] = state
+            self._sessions.move_to_end(session_id)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+# Shared store: every gunicorn worker on the box reads and writes the same SQLite file.
+# Saves are last-write-wins, as in the memory store: if two requests for one session
+# overlap, the one that finishes last replaces the other's changes wholesale.
+# Sessions untouched for ttl seconds read as new and are deleted by a purge that each
+# process runs at most once every purge_interval seconds; a ttl of 0 keeps them forever.
+class SQLiteSessionStore:
+    def __init__(self, path="cheeko_sessions.db", ttl=0, purge_interval=3600):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._next_purge = 0
+        self._connections = LocalConnections(path, (
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)",
+        ), self._open)
+
+    @staticmethod
+    def _open(path):
+        conn = sqlite3.connect(path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _connect(self):
+        return self._connections.get()
+
+    def _expired_before(self):
+        return time.time() - self.ttl if self.ttl else 0
+
+    def get(self, session_id):
+        row = self._connect().execute(
+            "SELECT state FROM sessions WHERE session_id = ? AND updated_at >= ?",
+            (session_id, self._expired_before())
+        ).fetchone()
+        if row is None:
+            return new_session_state()
+        state = json.loads(row[0])
+        state["chat_history"] = deque(state["chat_history"])
+        # Written before the parental log moved to durable_log.ParentalLog
+        state.pop("parental_log", None)
+        return state
+
+    def save(self, session_id, state):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state, default=list), time.time())
+            )
+        self._purge()
+
+    def _purge(self):
+        if not self.ttl or time.time() < self._next_purge:
+            return
+        self._next_purge = time.time() + self.purge_interval
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (self._expired_before(),))
+
+    def delete(self, session_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+
+def create_session_store():
+    backend = os.environ.get("CHEEKO_SESSION_BACKEND", "memory")
+    if backend == "sqlite":
+        return SQLiteSessionStore(
+            os.environ.get("CHEEKO_SESSION_DB", "cheeko_sessions.db"),
+            float(os.environ.get("CHEEKO_SESSION_TTL", "604800"))
+        )
+    if backend == "memory":
+        return MemorySessionStore(int(os.environ.get("CHEEKO_MAX_SESSIONS", "10000")))
+    raise ValueError(f"Unknown session backend: {backend}")
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+
+
+# Concurrent callers with the same key share one upstream call. Followers wait at most
+# `timeout` seconds for the leader, then make their own call rather than stall; they
+# do the same if the leader is interrupted, while a leader's error is shared with them.
+class LeaderAborted(Exception):
+    pass
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, timeout=30.0):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        call.result = result
+        call.error = error
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.done.set()
+
+    def abort(self, key, call):
+        self.finish(key, call, error=LeaderAborted())
+
+    # Returns (True, result) once the leader is done, (False, None) if it timed out or aborted
+    def wait(self, call):
+        if not call.done.wait(self.timeout) or isinstance(call.error, LeaderAborted):
+            return False, None
+        if call.error is not None:
+            raise call.error
+        return True, call.result
+
+    def do(self, key, fn):
+        call, is_leader = self.begin(key)
+        if not is_leader:
+            finished, result = self.wait(call)
+            return result if finished else fn()
+        try:
+            result = fn()
+        except Exception as error:
+            self.finish(key, call, error=error)
+            raise
+        except BaseException:
+            self.abort(key, call)
+            raise
+        self.finish(key, call, result=result)
+        return result
+
+
+# Same contract for coroutines sharing one event loop
+class AsyncSingleFlight:
+    def __init__(self, timeout=30.0):
+        self.timeout = timeout
+        self._calls = {}
+
+    def begin(self, key):
+        future = self._calls.get(key)
+        if future is not None:
+            return future, False
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        return future, True
+
+    def finish(self, key, future, result=None, error=None):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+            # Followers may have all timed out; don't warn about an unread error
+            future.exception()
+        else:
+            future.set_result(result)
+
+    def abort(self, key, future):
+        self.finish(key, future, error=LeaderAborted())
+
+    async def wait(self, future):
+        try:
+            return True, await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except (asyncio.TimeoutError, LeaderAborted):
+            return False, None
+
+    async def do(self, key, fn):
+        future, is_leader = self.begin(key)
+        if not is_leader:
+            finished, result = await self.wait(future)
+            return result if finished else await fn()
+        try:
+            result = await fn()
+        except Exception as error:
+            self.finish(key, future, error=error)
+            raise
+        except BaseException:
+            self.abort(key, future)
+            raise
+        self.finish(key, future, result=result)
+        return result
@@ -0,0 +1,136 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("cheeko.story_pool")
+
+
+# A few ready-made stories per child, generated in the background so a bedtime
+# request can be answered at once. `generate(key)` returns one story, or None to stop
+# filling for now. Each child keeps at most per_child stories, each good for ttl
+# seconds; the least recently used children are dropped past max_children.
+# Every refresh seconds a sweeper replaces stories that would expire before the next
+# sweep, for children seen within the last ttl; the others are forgotten. Like the log
+# writer, the sweeper starts on first use in each process.
+class StoryPool:
+    def __init__(self, generate, per_child=2, ttl=21600, max_children=1000, workers=1, refresh=None):
+        self.generate = generate
+        self.per_child = per_child
+        self.ttl = ttl
+        self.max_children = max_children
+        self.refresh = refresh or ttl / 4
+        self.hits = 0
+        self.misses = 0
+        self._stories = OrderedDict()
+        self._seen = {}
+        self._filling = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cheeko-stories")
+        self._closed = threading.Event()
+        self._sweeper_pid = None
+        # concurrent.futures waits for its workers at exit through this same hook, and
+        # from then on refuses new futures, which crewai needs. Registered later, ours
+        # runs first: queued fills are cancelled and the one in flight finishes while
+        # crewai still works, instead of failing on an interpreter that is shutting down.
+        getattr(threading, "_register_atexit", atexit.register)(self.close)
+
+    def _fresh(self, key):
+        stories = self._stories.get(key)
+        if stories is None:
+            return None
+        now = time.time()
+        while stories and stories[0][1] < now:
+            stories.popleft()
+        return stories
+
+    def take(self, key):
+        with self._lock:
+            stories = self._fresh(key)
+            story = stories.popleft()[0] if stories else None
+            if story is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._stories.move_to_end(key)
+        self.refill(key)
+        return story
+
+    def refill(self, key):
+        if not self.per_child:
+            return
+        self._ensure_sweeper()
+        with self._lock:
+            self._seen[key] = time.time()
+            self._submit(key)
+
+    # Called with the lock held
+    def _submit(self, key):
+        stories = self._fresh(key)
+        if self._closed.is_set() or key in self._filling or (stories is not None and len(stories) >= self.per_child):
+            return
+        self._filling.add(key)
+        try:
+            self._executor.submit(self._fill, key)
+        except RuntimeError:
+            # The interpreter is exiting
+            self._filling.discard(key)
+
+    def close(self):
+        self._closed.set()
+        self._executor.shutdown(cancel_futures=True)
+
+    def _ensure_sweeper(self):
+        if self._sweeper_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sweeper_pid != os.getpid():
+                threading.Thread(target=self._sweep, name="cheeko-story-sweeper", daemon=True).start()
+                self._sweeper_pid = os.getpid()
+
+    def _sweep(self):
+        while not self._closed.wait(self.refresh):
+            now = time.time()
+            with self._lock:
+                for key, seen in list(self._seen.items()):
+                    if seen < now - self.ttl:
+                        del self._seen[key]
+                        self._stories.pop(key, None)
+                for key, stories in self._stories.items():
+                    while stories and stories[0][1] < now + self.refresh:
+                        stories.popleft()
+                    self._submit(key)
+
+    def _fill(self, key):
+        try:
+            while not self._closed.is_set():
+                with self._lock:
+                    stories = self._fresh(key)
+                    if key not in self._seen or (stories is not None and len(stories) >= self.per_child):
+                        return
+                story = self.generate(key)
+                if story is None:
+                    return
+                with self._lock:
+                    if key not in self._seen:
+                        return
+                    stories = self._stories.setdefault(key, deque())
+                    stories.append((story, time.time() + self.ttl))
+                    self._stories.move_to_end(key)
+                    while len(self._stories) > self.max_children:
+                        self._seen.pop(self._stories.popitem(last=False)[0], None)
+        except Exception:
+            if not self._closed.is_set():
+                logger.exception("Could not pre-generate a story for %s", key)
+        finally:
+            with self._lock:
+                self._filling.discard(key)
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            ready = sum(1 for stories in self._stories.values() for _, expires in stories if expires >= now)
+            return {"hits": self.hits, "misses": self.misses, "stories": ready}
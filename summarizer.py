@@ -0,0 +1,94 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from durable_log import LocalConnections
+
+logger = logging.getLogger("cheeko.summarizer")
+
+
+# A short running summary per child of everything that has left the history window.
+# Evicted entries are handed to fold() and merged in by a background worker once
+# batch_size of them are waiting, so a full history costs one LLM call every few turns
+# rather than one per turn, and the request only pays for reading the summary back.
+# `summarize(summary, entries)` returns the new summary, or None to keep the entries
+# for the next fold. clear() bumps the session's generation, and a merge started
+# before it is dropped instead of bringing the old summary back.
+class ConversationSummarizer:
+    def __init__(self, summarize, path="cheeko_history.db", max_pending=50, batch_size=5):
+        self.summarize = summarize
+        self.path = path
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self._pending = {}
+        self._running = set()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cheeko-summarizer")
+        self._connections = LocalConnections(path, (
+            "CREATE TABLE IF NOT EXISTS conversation_summary ("
+            "session_id TEXT PRIMARY KEY, summary TEXT NOT NULL, updated_at REAL NOT NULL)",
+        ))
+
+    def _connect(self):
+        return self._connections.get()
+
+    def get(self, session_id):
+        row = self._connect().execute(
+            "SELECT summary FROM conversation_summary WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else ""
+
+    def fold(self, session_id, entries):
+        if not entries:
+            return
+        with self._lock:
+            pending = self._pending.setdefault(session_id, [])
+            pending.extend(entries)
+            # If the LLM keeps refusing, the oldest unsummarized entries are let go
+            del pending[:-self.max_pending]
+            if session_id in self._running or len(pending) < self.batch_size:
+                return
+            self._running.add(session_id)
+        self._executor.submit(self._run, session_id)
+
+    def clear(self, session_id):
+        with self._lock:
+            self._pending.pop(session_id, None)
+            self._generations[session_id] = self._generations.get(session_id, 0) + 1
+        with self._connect() as conn:
+            conn.execute("DELETE FROM conversation_summary WHERE session_id = ?", (session_id,))
+
+    def _run(self, session_id):
+        while True:
+            with self._lock:
+                entries = self._pending.pop(session_id, None)
+                if not entries:
+                    self._running.discard(session_id)
+                    return
+                generation = self._generations.get(session_id, 0)
+            try:
+                summary = self.summarize(self.get(session_id), entries)
+                if summary is not None:
+                    # Checked and written under the lock, so a clear() lands either
+                    # before the check or after the write, whose row it then deletes
+                    with self._lock, self._connect() as conn:
+                        if self._generations.get(session_id, 0) != generation:
+                            continue
+                        conn.execute(
+                            "INSERT OR REPLACE INTO conversation_summary (session_id, summary, updated_at) VALUES (?, ?, ?)",
+                            (session_id, summary, time.time())
+                        )
+            except Exception:
+                logger.exception("Could not update the summary for session %s", session_id)
+                summary = None
+            if summary is None:
+                with self._lock:
+                    if self._generations.get(session_id, 0) != generation:
+                        self._running.discard(session_id)
+                        return
+                    pending = self._pending[session_id] = entries + self._pending.get(session_id, [])
+                    del pending[:-self.max_pending]
+                    self._running.discard(session_id)
+                return
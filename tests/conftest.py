@@ -0,0 +1,15 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# Tests that import app (directly or through replay) run offline, with their logs
+# and summaries in a throwaway directory
+scratch_dir = tempfile.mkdtemp(prefix="cheeko-tests-")
+atexit.register(shutil.rmtree, scratch_dir, ignore_errors=True)
+os.environ.setdefault("CHEEKO_LLM_BACKEND", "fake")
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+os.environ.setdefault("CHEEKO_SESSION_BACKEND", "memory")
+os.environ.setdefault("CHEEKO_STORY_POOL_SIZE", "0")
+for name in ("CHEEKO_HISTORY_LOG", "CHEEKO_PARENTAL_LOG", "CHEEKO_SUMMARY_DB"):
+    os.environ.setdefault(name, os.path.join(scratch_dir, "cheeko_history.db"))
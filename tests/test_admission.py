@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, Overloaded
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def queue_waiter(controller, priority, outcomes):
+    def run():
+        try:
+            controller.release(controller.acquire(priority))
+            outcomes[priority] = "admitted"
+        except Overloaded:
+            outcomes[priority] = "rejected"
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_unlimited_budget_admits_at_once():
+    controller = AdmissionController()
+    with controller.admit(2, 5, 10000):
+        pass
+    assert controller.stats()["admitted"] == {2: 1}
+
+
+def test_higher_priority_bumps_the_lowest_waiter_from_a_full_queue():
+    controller = AdmissionController(rpm=1, max_queue=1, max_wait=5)
+    held = controller.acquire(0)
+    outcomes = {}
+    background = queue_waiter(controller, 3, outcomes)
+    wait_for(lambda: controller.stats()["queue_depth"] == 1)
+    urgent = queue_waiter(controller, 0, outcomes)
+    background.join(2)
+    assert outcomes == {3: "rejected"}
+    controller.release(held)
+    urgent.join(2)
+    assert outcomes[0] == "admitted"
+
+
+def test_full_queue_turns_away_an_equal_or_lower_priority():
+    controller = AdmissionController(rpm=1, max_queue=1, max_wait=5)
+    held = controller.acquire(0)
+    outcomes = {}
+    waiting = queue_waiter(controller, 1, outcomes)
+    wait_for(lambda: controller.stats()["queue_depth"] == 1)
+    with pytest.raises(Overloaded):
+        controller.acquire(2)
+    controller.release(held)
+    waiting.join(2)
+    assert outcomes == {1: "admitted"}
+    assert controller.stats()["rejected"] == {2: 1}
+
+
+def test_waiter_gives_up_after_max_wait():
+    controller = AdmissionController(rpm=1, max_wait=0.1)
+    controller.acquire(2)
+    with pytest.raises(Overloaded):
+        controller.acquire(2)
+    assert controller.stats()["queue_depth"] == 0
@@ -0,0 +1,48 @@
+from durable_log import ConversationLog, ParentalLog
+
+
+def entry(seq, text):
+    return {"seq": seq, "timestamp": 1000.0 + seq, "input": text, "intent": "fallback", "output": f"re: {text}"}
+
+
+def test_empty_page_has_no_cursor(tmp_path):
+    log = ConversationLog(str(tmp_path / "log.db"), 0)
+    log.append("a", entry(0, "hi"))
+    log.writer.flush()
+    assert log.read("a", limit=0) == ([], None)
+    assert log.read("nobody") == ([], None)
+
+
+def test_first_write_to_a_fresh_database_creates_the_table(tmp_path):
+    log = ConversationLog(str(tmp_path / "log.db"), 0)
+    log.record_clear("a")
+    log.writer.flush()
+    entries, _ = log.read("a")
+    assert [e["kind"] for e in entries] == ["clear"]
+
+
+def test_pages_newest_first_until_the_cursor_runs_out(tmp_path):
+    log = ConversationLog(str(tmp_path / "log.db"), 0)
+    for seq in range(5):
+        log.append("a", entry(seq, f"m{seq}"))
+    log.append("b", entry(0, "other child"))
+    log.writer.flush()
+    seen = []
+    cursor = None
+    while True:
+        entries, cursor = log.read("a", before=cursor, limit=2)
+        seen.extend(e["input"] for e in entries)
+        if cursor is None:
+            break
+    assert seen == ["m4", "m3", "m2", "m1", "m0"]
+
+
+def test_parental_log_filters_by_type_and_time(tmp_path):
+    log = ParentalLog(str(tmp_path / "log.db"), 0)
+    log.record("a", "message", "hello")
+    log.record("a", "overuse", "too long")
+    log.record("b", "overuse", "someone else")
+    log.writer.flush()
+    alerts, cursor = log.query("a", event_types=["overuse"])
+    assert [a["message"] for a in alerts] == ["too long"] and cursor is None
+    assert log.query("a", since=alerts[0]["timestamp"] + 1) == ([], None)
@@ -0,0 +1,46 @@
+from history import append_history, clear_history, search_history
+from session_store import new_session_state
+
+
+def entry(text, intent="fallback", flags=None):
+    return {"input": text, "intent": intent, "output": "", "flags": flags or {}}
+
+
+def test_window_evicts_oldest_and_its_index_postings():
+    state = new_session_state()
+    for text in ["dragons fly", "math quiz", "dragons sleep"]:
+        append_history(state, entry(text), 2)
+    assert [e["input"] for e in state["chat_history"]] == ["math quiz", "dragons sleep"]
+    assert "fly" not in state["history_index"]
+    assert state["history_index"]["dragons"] == [2]
+    evicted = append_history(state, entry("hello"), 2)
+    assert [e["input"] for e in evicted] == ["math quiz"]
+
+
+def test_flag_counts_follow_the_window():
+    state = new_session_state()
+    append_history(state, entry("i am sad", flags={"emotional": True}), 2)
+    append_history(state, entry("so sad", flags={"emotional": True}), 2)
+    assert state["flag_counts"]["emotional"] == 2
+    append_history(state, entry("ok now"), 2)
+    assert state["flag_counts"]["emotional"] == 1
+
+
+def test_search_ranks_by_shared_tokens_then_newest():
+    state = new_session_state()
+    for text in ["dragon story", "dragon story tonight", "math", "dragon"]:
+        append_history(state, entry(text), 10)
+    found = search_history(state, "dragon story tonight", limit=3)
+    assert [e["input"] for e in found] == ["dragon story tonight", "dragon story", "dragon"]
+    assert search_history(state, "unicorns") == []
+
+
+def test_search_after_eviction_and_clear():
+    state = new_session_state()
+    for text in ["dragon", "math", "dragon again"]:
+        append_history(state, entry(text), 2)
+    assert [e["input"] for e in search_history(state, "dragon")] == ["dragon again"]
+    clear_history(state)
+    assert search_history(state, "dragon") == []
+    append_history(state, entry("dragon"), 2)
+    assert [e["input"] for e in search_history(state, "dragon")] == ["dragon"]
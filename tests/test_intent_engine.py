@@ -0,0 +1,38 @@
+from intent_engine import INTENT_RULES, IntentEngine
+
+
+def test_earlier_rule_wins_when_keywords_start_at_the_same_place():
+    engine = IntentEngine([
+        {"intent": "emotional_checkin", "keywords": ["sad"]},
+        {"intent": "bedtime_story", "keywords": ["sad story"]}
+    ])
+    assert engine.match("tell me a sad story") == "emotional_checkin"
+
+
+def test_longer_keyword_of_the_same_rule_still_matches():
+    engine = IntentEngine([
+        {"intent": "bedtime_story", "keywords": ["story", "story for sleep"]},
+        {"intent": "emotional_checkin", "keywords": ["sleep"]}
+    ])
+    assert engine.match("a story for sleep") == "bedtime_story"
+
+
+def test_keywords_overlapping_an_earlier_match_are_seen():
+    engine = IntentEngine([
+        {"intent": "math_quiz", "keywords": ["numbers"]},
+        {"intent": "riddle", "keywords": ["riddle"]}
+    ])
+    assert engine.match("riddlenumbers") == "math_quiz"
+
+
+def test_pattern_rule_beats_later_keywords():
+    engine = IntentEngine(INTENT_RULES)
+    assert engine.match("Hi Cheeko, math quiz please") == "greeting"
+    assert engine.match("I want a math quiz, hi") == "math_quiz"
+
+
+def test_default_rules():
+    engine = IntentEngine(INTENT_RULES)
+    assert engine.match("I'm sleepy and sad") == "bedtime_story"
+    assert engine.match("I feel SCARED") == "emotional_checkin"
+    assert engine.match("what is a rainbow") is None
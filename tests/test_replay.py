@@ -0,0 +1,41 @@
+import json
+
+from replay import id_key, load_checkpoint, read_records
+
+
+def write_lines(path, lines):
+    path.write_text("".join(line + "\n" for line in lines))
+
+
+def test_records_with_unhashable_ids_are_read_and_skipped(tmp_path):
+    records = tmp_path / "in.jsonl"
+    write_lines(records, [
+        json.dumps({"id": ["a", 1], "input": "hi"}),
+        json.dumps({"id": {"child": "b"}, "input": "math quiz"}),
+        json.dumps({"input": "no id"}),
+        "not json",
+        ""
+    ])
+    assert [r["id"] for r in read_records(records, set())] == [["a", 1], {"child": "b"}, 3, 4]
+    done = {id_key(["a", 1]), id_key(3)}
+    assert [r["id"] for r in read_records(records, done)] == [{"child": "b"}, 4]
+
+
+def test_id_key_ignores_key_order():
+    assert id_key({"a": 1, "b": 2}) == id_key({"b": 2, "a": 1})
+    assert id_key(1) != id_key("1")
+
+
+def test_checkpoint_retries_errors_and_drops_a_cut_off_line(tmp_path):
+    out = tmp_path / "out.jsonl"
+    out.write_text(
+        json.dumps({"id": ["a", 1], "output": "ok"}) + "\n"
+        + json.dumps({"id": "x", "error": "overloaded"}) + "\n"
+        + '{"id": "cut'
+    )
+    assert load_checkpoint(out) == {id_key(["a", 1])}
+    assert out.read_text().endswith("\n")
+
+
+def test_missing_checkpoint_is_empty(tmp_path):
+    assert load_checkpoint(tmp_path / "none.jsonl") == set()
@@ -0,0 +1,35 @@
+from response_cache import SemanticCache, wants_fresh
+
+SCOPE = ("math_quiz", "Ana", 7)
+
+
+def test_reworded_ask_hits_within_its_scope_only():
+    cache = SemanticCache(max_entries=4)
+    cache.put(SCOPE, "tell me a math quiz", "2 + 2?", 60)
+    assert cache.get(SCOPE, "math quiz please") == "2 + 2?"
+    assert cache.get(("math_quiz", "Ben", 7), "math quiz please") is None
+    assert cache.get(SCOPE, "a bedtime story about owls") is None
+
+
+def test_expired_entries_are_dropped():
+    cache = SemanticCache(max_entries=4)
+    cache.put(SCOPE, "math quiz", "old", -1)
+    assert cache.get(SCOPE, "math quiz") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_slot_is_reused_when_full():
+    cache = SemanticCache(max_entries=2)
+    cache.put(SCOPE, "math quiz", "quiz", 60)
+    cache.put(SCOPE, "numbers game", "numbers", 60)
+    assert cache.get(SCOPE, "math quiz") == "quiz"
+    cache.put(SCOPE, "counting fun", "counting", 60)
+    assert cache.get(SCOPE, "numbers game") is None
+    assert cache.get(SCOPE, "math quiz") == "quiz"
+    assert cache.get(SCOPE, "counting fun") == "counting"
+
+
+def test_asks_for_something_new_skip_the_cache():
+    assert wants_fresh("math quiz again!")
+    assert wants_fresh("Another one")
+    assert not wants_fresh("math quiz please")
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_followers_share_the_leaders_result():
+    flight = SingleFlight()
+    call, is_leader = flight.begin("k")
+    assert is_leader
+    follower, is_leader = flight.begin("k")
+    assert follower is call and not is_leader
+    flight.finish("k", call, result="story")
+    assert flight.wait(follower) == (True, "story")
+    assert flight.begin("k")[1]
+
+
+def test_follower_runs_its_own_call_after_the_timeout():
+    flight = SingleFlight(timeout=0.05)
+    flight.begin("k")
+    assert flight.do("k", lambda: "own") == "own"
+
+
+def test_follower_runs_its_own_call_when_the_leader_aborts():
+    flight = SingleFlight()
+    call, _ = flight.begin("k")
+    follower, _ = flight.begin("k")
+    flight.abort("k", call)
+    assert flight.wait(follower) == (False, None)
+
+
+def test_leaders_error_is_shared():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.05)
+        raise ValueError("upstream down")
+
+    errors = []
+
+    def lead():
+        try:
+            flight.do("k", fail)
+        except ValueError as error:
+            errors.append(error)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    started.wait(1)
+    with pytest.raises(ValueError) as shared:
+        flight.do("k", lambda: "never")
+    leader.join(1)
+    assert errors == [shared.value]
+
+
+def test_async_follower_times_out_and_aborts():
+    async def main():
+        flight = AsyncSingleFlight(timeout=0.05)
+        future, _ = flight.begin("k")
+        assert await flight.do("k", lambda: asyncio.sleep(0, "own")) == "own"
+        follower, _ = flight.begin("k")
+        flight.abort("k", future)
+        assert await flight.wait(follower) == (False, None)
+
+    asyncio.run(main())